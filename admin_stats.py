@@ -0,0 +1,197 @@
+"""
+VibeSync admin statistics - dashboard totals without full-table counts.
+
+Three ways to get the figures behind GET /api/admin/stats (ADMIN_STATS_MODE,
+or ?mode=):
+
+  counters  (default) read the stat_counters table, kept current by
+            statement-level triggers on users, recently_played and
+            emotion_history. A write-behind batch is a single counter update.
+  estimate  planner statistics: pg_class.reltuples and the is_active
+            frequency in pg_stats (as fresh as the last ANALYZE)
+  exact     COUNT(*) every time - the old behaviour, for verification
+
+Plays and emotions are all-time totals: rows rolled up into the *_daily
+tables by history_storage still count. Dropping an expired partition or
+deleting from a partition directly (the retention job does both) does not
+fire the parent's triggers, so the counters stay all-time.
+"""
+import os
+
+ADMIN_STATS_MODE = os.getenv('ADMIN_STATS_MODE', 'counters').lower()
+STATS_MODES = ('counters', 'estimate', 'exact')
+
+_COUNTER_TRIGGERS = {
+    # table: counter name
+    'recently_played': 'plays',
+    'emotion_history': 'emotions'
+}
+
+
+def _installed_triggers(cursor):
+    cursor.execute('''
+        SELECT tgname FROM pg_trigger
+        WHERE tgrelid IN (to_regclass('users'), to_regclass('recently_played'), to_regclass('emotion_history'))
+        AND NOT tgisinternal
+    ''')
+    return {row['tgname'] for row in cursor.fetchall()}
+
+
+def ensure_stat_counters(conn):
+    """Create the counters table and missing triggers; seed counters that are missing
+
+    Once everything is installed this only reads the catalogs, so worker
+    boots do not lock the counted tables.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ('vibesync_stat_counters',))
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stat_counters (
+                name VARCHAR(50) PRIMARY KEY,
+                value BIGINT NOT NULL,
+                refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION vibesync_count_rows() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE stat_counters SET value = value + (SELECT COUNT(*) FROM new_rows),
+                                             refreshed_at = CURRENT_TIMESTAMP
+                    WHERE name = TG_ARGV[0];
+                ELSE
+                    UPDATE stat_counters SET value = value - (SELECT COUNT(*) FROM old_rows),
+                                             refreshed_at = CURRENT_TIMESTAMP
+                    WHERE name = TG_ARGV[0];
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION vibesync_count_users() RETURNS trigger AS $$
+            DECLARE
+                added BIGINT := 0;
+                added_active BIGINT := 0;
+                removed BIGINT := 0;
+                removed_active BIGINT := 0;
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    SELECT COUNT(*), COUNT(*) FILTER (WHERE is_active) INTO added, added_active FROM new_rows;
+                END IF;
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    SELECT COUNT(*), COUNT(*) FILTER (WHERE is_active) INTO removed, removed_active FROM old_rows;
+                END IF;
+                -- Logins update users too; only touch the counters when a total moves
+                IF added <> removed THEN
+                    UPDATE stat_counters SET value = value + added - removed, refreshed_at = CURRENT_TIMESTAMP
+                    WHERE name = 'users';
+                END IF;
+                IF added_active <> removed_active THEN
+                    UPDATE stat_counters SET value = value + added_active - removed_active,
+                                             refreshed_at = CURRENT_TIMESTAMP
+                    WHERE name = 'active_users';
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        ''')
+
+        # Transition tables allow one event per trigger
+        triggers = [('users', 'vibesync_count_users', '')]
+        triggers += [(table, 'vibesync_count_rows', f"'{name}'") for table, name in _COUNTER_TRIGGERS.items()]
+        installed = _installed_triggers(cursor)
+        for table, function, argument in triggers:
+            for event, referencing in (('INSERT', 'NEW TABLE AS new_rows'),
+                                       ('DELETE', 'OLD TABLE AS old_rows'),
+                                       ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows')):
+                if event == 'UPDATE' and table != 'users':
+                    continue
+                if f'{table}_count_{event.lower()}' in installed:
+                    continue
+                cursor.execute(f'''
+                    CREATE TRIGGER {table}_count_{event.lower()}
+                    AFTER {event} ON {table}
+                    REFERENCING {referencing}
+                    FOR EACH STATEMENT EXECUTE FUNCTION {function}({argument})
+                ''')
+
+        # Seed with writers locked out until commit, so nothing is counted
+        # twice or missed
+        cursor.execute('SELECT name FROM stat_counters')
+        existing = {row['name'] for row in cursor.fetchall()}
+        if existing < {'users', 'active_users', 'plays', 'emotions'}:
+            cursor.execute('LOCK TABLE users, recently_played, emotion_history IN SHARE ROW EXCLUSIVE MODE')
+            for name, value in _exact_counts(cursor).items():
+                if name not in existing:
+                    cursor.execute('INSERT INTO stat_counters (name, value) VALUES (%s, %s)', (name, value))
+    conn.commit()
+
+
+def _exact_counts(cursor):
+    cursor.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM users) AS users,
+            (SELECT COUNT(*) FROM users WHERE is_active = TRUE) AS active_users,
+            (SELECT COUNT(*) FROM recently_played)
+                + (SELECT COALESCE(SUM(plays), 0) FROM recently_played_daily) AS plays,
+            (SELECT COUNT(*) FROM emotion_history)
+                + (SELECT COALESCE(SUM(detections), 0) FROM emotion_history_daily) AS emotions
+    ''')
+    row = cursor.fetchone()
+    return {name: int(row[name]) for name in ('users', 'active_users', 'plays', 'emotions')}
+
+
+def _estimated_counts(cursor):
+    cursor.execute('''
+        WITH tuples AS (
+            SELECT root, SUM(GREATEST(c.reltuples, 0)) AS estimate
+            FROM unnest(ARRAY['users', 'recently_played', 'emotion_history']) AS root
+            CROSS JOIN LATERAL pg_partition_tree(root::regclass) AS tree
+            JOIN pg_class c ON c.oid = tree.relid
+            GROUP BY root
+        ), active AS (
+            SELECT most_common_freqs[array_position(most_common_vals::text::boolean[], TRUE)] AS share
+            FROM pg_stats
+            WHERE schemaname = current_schema() AND tablename = 'users' AND attname = 'is_active'
+        )
+        SELECT
+            (SELECT estimate FROM tuples WHERE root = 'users') AS users,
+            (SELECT estimate FROM tuples WHERE root = 'users')
+                * COALESCE((SELECT share FROM active), 1.0) AS active_users,
+            (SELECT estimate FROM tuples WHERE root = 'recently_played') AS plays,
+            (SELECT estimate FROM tuples WHERE root = 'emotion_history') AS emotions,
+            (SELECT MIN(GREATEST(last_analyze, last_autoanalyze))
+             FROM pg_stat_user_tables
+             WHERE relname IN ('users', 'recently_played', 'emotion_history')
+                OR relname LIKE 'recently_played\\_p%' OR relname LIKE 'emotion_history\\_p%') AS refreshed_at
+    ''')
+    row = cursor.fetchone()
+    counts = {name: int(round(row[name] or 0)) for name in ('users', 'active_users', 'plays', 'emotions')}
+    # Rolled-up history: the daily tables are small, sum them exactly
+    cursor.execute('''
+        SELECT (SELECT COALESCE(SUM(plays), 0) FROM recently_played_daily) AS plays,
+               (SELECT COALESCE(SUM(detections), 0) FROM emotion_history_daily) AS emotions
+    ''')
+    rolled_up = cursor.fetchone()
+    counts['plays'] += int(rolled_up['plays'])
+    counts['emotions'] += int(rolled_up['emotions'])
+    return counts, row['refreshed_at']
+
+
+def read_stats(cursor, mode=ADMIN_STATS_MODE):
+    """Return ({'users', 'active_users', 'plays', 'emotions'}, refreshed_at) for a mode"""
+    if mode == 'exact':
+        cursor.execute('SELECT CURRENT_TIMESTAMP AS now')
+        now = cursor.fetchone()['now']
+        return _exact_counts(cursor), now
+
+    if mode == 'estimate':
+        return _estimated_counts(cursor)
+
+    cursor.execute('SELECT name, value, refreshed_at FROM stat_counters')
+    rows = cursor.fetchall()
+    counts = {row['name']: int(row['value']) for row in rows}
+    refreshed_at = max((row['refreshed_at'] for row in rows), default=None)
+    return counts, refreshed_at
@@ -1,28 +1,40 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
-import cv2
-from tensorflow import keras
-import tensorflow as tf
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, g, has_app_context
+from flask import Response, stream_with_context, after_this_request, send_file
 import numpy as np
 import base64
-import io
-from PIL import Image
+import binascii
+import json
+import re
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from bson import ObjectId
 from datetime import datetime
 import os
-import psycopg2
+import atexit
 from psycopg2.extras import RealDictCursor
+from db_pool import PostgresPool
+from write_behind import WriteBehindQueue
+from history_storage import ensure_history_storage, run_history_maintenance
+from admin_stats import ensure_stat_counters, read_stats, ADMIN_STATS_MODE, STATS_MODES
+from song_cache import SongCache
+from favorites_cache import FavoritesCache
+from emotion_index import EmotionIndex
+from song_import import SongImport, prepare_import, read_progress
+from media_storage import create_media_storage
+from media_jobs import MediaJobQueue
+from audio_renditions import create_renditions, transcoding_enabled, bitrate_budget, pick_rendition, AUDIO_RENDITIONS
 from urllib.parse import urlparse
 import hashlib
 import secrets
 from functools import wraps
-from werkzeug.utils import secure_filename
-from deepface import DeepFace
+from inference_pool import create_inference_backend, InferenceTimeout, INFERENCE_MODE
+from model_registry import current_rss_bytes
+from emotion_smoothing import EmotionTracker
+from face_landmarks import landmarks_for_faces, landmarks_as_dicts
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
@@ -30,13 +42,18 @@ CORS(app)
 load_dotenv()
 
 
-# Cloudinary configuration
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET'),
-    secure=True
-)
+# Media storage backend (MEDIA_BACKEND=cloudinary|local, see media_storage.py)
+media_storage = create_media_storage()
+
+# Uploaded files wait here until a media job has stored them
+MEDIA_SPOOL_DIR = os.getenv('MEDIA_SPOOL_DIR', os.path.join('instance', 'media_spool'))
+MEDIA_SPOOL_URL = '/media/spool'
+
+# Lower-bitrate AAC renditions of uploaded audio (needs ffmpeg, see audio_renditions.py)
+if transcoding_enabled():
+    print(f"✓ Audio renditions enabled: {', '.join(map(str, AUDIO_RENDITIONS))} kbps")
+else:
+    print("⚠️ ffmpeg/ffprobe not found - uploaded songs will only have their original audio")
 
 ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a', 'flac'}
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -44,6 +61,37 @@ MAX_FILE_SIZE = 50 * 1024 * 1024
  
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
+# Bulk imports may read media from directories under this root (mediaDir=)
+SONG_IMPORT_MEDIA_ROOT = os.getenv('SONG_IMPORT_MEDIA_ROOT', os.path.join(app.root_path, 'static', 'uploads'))
+
+# ENABLE_EMOTION_DETECTION=false gives an API-only deployment that never
+# imports TensorFlow, OpenCV or DeepFace. Otherwise the ML stack is imported
+# on first use (or by the warm-up below), never at module import time.
+ENABLE_EMOTION_DETECTION = os.getenv('ENABLE_EMOTION_DETECTION', 'true').lower() in ('1', 'true', 'yes')
+
+# Emotion inference backend: 'inline' runs in this worker, 'service' sends
+# frames to the inference service (python inference_pool.py).
+# Micro-batching only helps inline with threaded workers,
+# e.g. gunicorn --worker-class gthread --threads 8
+EMOTION_BATCH_MAX_SIZE = int(os.getenv('EMOTION_BATCH_MAX_SIZE', '16'))
+EMOTION_BATCH_MAX_WAIT_MS = float(os.getenv('EMOTION_BATCH_MAX_WAIT_MS', '5'))
+inference_backend = None
+emotion_tracker = EmotionTracker(
+    alpha=float(os.getenv('EMOTION_EMA_ALPHA', '0.4')),
+    max_reuse_seconds=float(os.getenv('EMOTION_MAX_REUSE_SECONDS', '15'))
+)
+
+# /detect_emotion/frame takes the raw encoded frame as the request body
+MAX_FRAME_BYTES = int(os.getenv('MAX_FRAME_BYTES', str(2 * 1024 * 1024)))
+FRAME_CONTENT_TYPES = {'application/octet-stream', 'image/jpeg', 'image/webp', 'image/png'}
+
+if ENABLE_EMOTION_DETECTION:
+    inference_backend = create_inference_backend(
+        INFERENCE_MODE,
+        max_batch_size=EMOTION_BATCH_MAX_SIZE,
+        max_wait_ms=EMOTION_BATCH_MAX_WAIT_MS
+    )
+
 # ============================================================
 # MongoDB Configuration (Keep as is)
 # ============================================================
@@ -62,6 +110,32 @@ except Exception as e:
     db = client['vibesync_db']
     songs_collection = db['songs']
 
+# In-process song metadata cache; invalidated by the admin song routes.
+# Share SONG_CACHE_VERSION_FILE between workers to invalidate them all.
+song_cache = SongCache(
+    max_entries=int(os.getenv('SONG_CACHE_MAX_ENTRIES', '1024')),
+    ttl_seconds=float(os.getenv('SONG_CACHE_TTL_SECONDS', '300')),
+    version_file=os.getenv('SONG_CACHE_VERSION_FILE')
+)
+
+# Per-user favorite flags; add/remove invalidate the user in every worker
+# through the shared FAVORITES_CACHE_INVALIDATION_LOG
+favorites_cache = FavoritesCache(
+    max_users=int(os.getenv('FAVORITES_CACHE_MAX_USERS', '10000')),
+    ttl_seconds=float(os.getenv('FAVORITES_CACHE_TTL_SECONDS', '60')),
+    invalidation_log=os.getenv('FAVORITES_CACHE_INVALIDATION_LOG',
+                               os.path.join('instance', 'favorites_invalidations.log')),
+    sync_interval_ms=int(os.getenv('FAVORITES_CACHE_SYNC_MS', '250'))
+)
+FAVORITES_STATUS_MAX_IDS = 500
+
+# Emotion -> songs index for recommendations, rebuilt from Mongo when
+# another worker changes the catalog or after EMOTION_INDEX_MAX_AGE_SECONDS
+emotion_index = EmotionIndex(max_age_seconds=float(os.getenv('EMOTION_INDEX_MAX_AGE_SECONDS', '300')))
+
+# How many of a user's latest plays to keep out of recommendations
+RECOMMENDATION_EXCLUDE_RECENT = 20
+
 # ============================================================
 # PostgreSQL Configuration (REPLACES SQLite)
 # ============================================================
@@ -83,22 +157,66 @@ POSTGRES_CONFIG = {
     'sslmode': 'require'
 }
 
+# Connection pool (DB_POOL_MODE=direct disables it, e.g. behind pgbouncer)
+db_pool = PostgresPool(
+    dict(POSTGRES_CONFIG, cursor_factory=RealDictCursor),  # Returns dict-like rows
+    minconn=int(os.getenv('DB_POOL_MIN', '1')),
+    maxconn=int(os.getenv('DB_POOL_MAX', '10')),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    health_check_seconds=float(os.getenv('DB_POOL_HEALTH_CHECK_SECONDS', '30')),
+    mode=os.getenv('DB_POOL_MODE', 'pool').lower()
+)
+
+# emotion_history / recently_played rows are buffered and written in batches
+# (WRITE_BEHIND_ENABLED=false writes each row synchronously)
+history_writer = WriteBehindQueue(
+    db_pool,
+    {
+        'emotion_history': ('user_id', 'email', 'emotion', 'confidence', 'detected_at'),
+        'recently_played': ('user_id', 'email', 'song_id', 'song_title', 'artist', 'played_at')
+    },
+    flush_interval_ms=float(os.getenv('WRITE_BEHIND_FLUSH_MS', '500')),
+    batch_rows=int(os.getenv('WRITE_BEHIND_BATCH_ROWS', '500')),
+    max_pending=int(os.getenv('WRITE_BEHIND_MAX_PENDING', '10000')),
+    enqueue_timeout=float(os.getenv('WRITE_BEHIND_ENQUEUE_TIMEOUT', '2')),
+    enabled=os.getenv('WRITE_BEHIND_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+)
+atexit.register(history_writer.close)
+
 def get_db_connection():
-    """Get PostgreSQL connection"""
+    """Check out a pooled PostgreSQL connection; conn.close() returns it"""
     try:
-        conn = psycopg2.connect(
-            host=POSTGRES_CONFIG['host'],
-            port=POSTGRES_CONFIG['port'],
-            user=POSTGRES_CONFIG['user'],
-            password=POSTGRES_CONFIG['password'],
-            database=POSTGRES_CONFIG['database'],
-            sslmode=POSTGRES_CONFIG['sslmode'],
-            cursor_factory=RealDictCursor  # Returns dict-like rows
-        )
-        return conn
+        conn = db_pool.getconn()
     except Exception as e:
         print(f"❌ PostgreSQL connection error: {e}")
         raise
+    
+    # Remember it so release_db_connections() can return it even if the
+    # route bails out before calling close()
+    if has_app_context():
+        g.setdefault('db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connections(exc):
+    """Return any connection a request left checked out"""
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+# Song catalog paging (GET /api/songs)
+SONG_PAGE_SIZE = 50
+SONG_PAGE_SIZE_MAX = 200
+SONG_CATALOG_SORT = [('createdAt', -1), ('_id', -1)]
+SONG_SEARCH_MAX_LENGTH = 100
+SONG_FIELDS = {'title', 'artist', 'coverUrl', 'audioUrl', 'artistPhotoUrl', 'emotions',
+               'language', 'createdAt', 'updatedAt', 'uploadedBy', 'renditions', 'audioBitrate'}
+
+# Admin user listing paging (GET /api/admin/users)
+USER_PAGE_SIZE = 50
+USER_PAGE_SIZE_MAX = 200
+
+# Longest range the activity charts accept (?days=)
+MAX_CHART_DAYS = 366
 
 # ============================================================
 # SECURITY MIDDLEWARE
@@ -142,6 +260,12 @@ def init_postgres():
                 is_active BOOLEAN DEFAULT TRUE
             )
         ''')
+        # Admin user search (prefix match on email / names) and filters
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users (lower(email) text_pattern_ops)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_first_name_lower ON users (lower(first_name) text_pattern_ops)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_name_lower ON users (lower(last_name) text_pattern_ops)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_active_id ON users (is_active, id DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_admin_id ON users (id DESC) WHERE is_admin')
         
         # Create admin user if not exists
         admin_email = 'admin@music.com'
@@ -166,36 +290,17 @@ def init_postgres():
             ''', (admin_hash, admin_email))
             print(f"✓ Updated admin user: {admin_email} / {admin_password}")
         
-        # Emotion history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS emotion_history (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                email VARCHAR(255) NOT NULL,
-                emotion VARCHAR(50) NOT NULL,
-                confidence REAL NOT NULL,
-                detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_emotion_user_id ON emotion_history(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_emotion_detected_at ON emotion_history(detected_at)')
+        # Emotion history and recently played: partitioned by month, old
+        # months rolled up into daily tables (see history_storage.py)
+        conn.commit()
+        history_ready = ensure_history_storage(conn, wait=False)
         
-        # Recently played songs table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS recently_played (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                email VARCHAR(255) NOT NULL,
-                song_id VARCHAR(255) NOT NULL,
-                song_title VARCHAR(500) NOT NULL,
-                artist VARCHAR(500) NOT NULL,
-                played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recent_user_id ON recently_played(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recent_played_at ON recently_played(played_at)')
+        # Trigger-maintained totals for the admin dashboard (see admin_stats.py).
+        # Needs the history tables, which another process may still be creating
+        if history_ready:
+            ensure_stat_counters(conn)
+        else:
+            print("⚠️ Skipped stat counter setup until the history tables are ready")
         
         # Favorites table
         cursor.execute('''
@@ -228,6 +333,7 @@ def init_postgres():
             )
         ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_user_id ON playlists(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_user_updated ON playlists(user_id, updated_at DESC)')
         
         # Playlist songs junction table
         cursor.execute('''
@@ -246,6 +352,7 @@ def init_postgres():
             )
         ''')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_songs_playlist ON playlist_songs(playlist_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_playlist_songs_playlist_added ON playlist_songs(playlist_id, added_at)')
         
         conn.commit()
         print("✓ PostgreSQL database initialized")
@@ -271,6 +378,213 @@ def serialize_song(song):
     song['_id'] = str(song['_id'])
     return song
 
+def find_songs_cached(query, projection=None, sort=None, limit=0):
+    """Read-through cached songs_collection.find(); returns serialized songs"""
+    key = ('find', repr(query), repr(projection), repr(sort), limit)
+    
+    def load():
+        cursor = songs_collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [serialize_song(song) for song in cursor]
+    
+    return song_cache.get_or_load(key, load)
+
+def get_emotion_index():
+    """The emotion index, rebuilt from MongoDB if it is stale"""
+    emotion_index.refresh(song_cache.current_version(),
+                          lambda: [serialize_song(song) for song in songs_collection.find()])
+    return emotion_index
+
+def song_saved(song):
+    """Refresh caches after an admin created or updated a song"""
+    song_cache.invalidate()
+    emotion_index.upsert(song, song_cache.current_version())
+
+def songs_imported(songs):
+    """Refresh caches after a bulk import wrote a batch of songs"""
+    song_cache.invalidate()
+    version = song_cache.current_version()
+    for song in songs:
+        emotion_index.upsert(serialize_song(song), version)
+
+def song_deleted(song_id):
+    """Refresh caches after an admin deleted a song"""
+    song_cache.invalidate()
+    emotion_index.remove(song_id, song_cache.current_version())
+
+def get_recent_song_ids(cursor, user_id, limit=RECOMMENDATION_EXCLUDE_RECENT):
+    """Ids of the songs the user played most recently"""
+    cursor.execute('''
+        SELECT song_id FROM recently_played
+        WHERE user_id = %s
+        ORDER BY played_at DESC
+        LIMIT %s
+    ''', (user_id, limit))
+    return {row['song_id'] for row in cursor.fetchall()}
+
+def parse_emotion_weights(value):
+    """Parse 'happy:70,neutral:30' into {'happy': 70.0, 'neutral': 30.0}"""
+    weights = {}
+    for part in value.split(','):
+        emotion, _, weight = part.partition(':')
+        emotion = emotion.strip().lower()
+        if emotion:
+            weights[emotion] = float(weight) if weight.strip() else 1.0
+    return weights
+
+def fetch_songs_by_ids(song_ids):
+    """Fetch many songs keyed by string id, from the cache or one $in query
+    
+    Ids that are not valid ObjectIds, or whose songs were deleted, are
+    simply missing from the result.
+    """
+    song_ids = {song_id for song_id in song_ids if ObjectId.is_valid(song_id)}
+    cached = song_cache.get_many(('song', song_id) for song_id in song_ids)
+    songs = {key[1]: song for key, song in cached.items()}
+    
+    missing = [ObjectId(song_id) for song_id in song_ids if ('song', song_id) not in cached]
+    if missing:
+        for doc in songs_collection.find({'_id': {'$in': missing}}):
+            songs[str(doc['_id'])] = serialize_song(doc)
+        # Cache misses too (None) so deleted songs do not hit Mongo every time
+        for object_id in missing:
+            song_cache.set(('song', str(object_id)), songs.get(str(object_id)))
+    
+    return {song_id: song for song_id, song in songs.items() if song}
+
+def parse_song_fields(fields):
+    """Turn ?fields=title,artist into a Mongo projection (None = all fields)"""
+    fields = [f.strip() for f in fields.split(',') if f.strip()]
+    if not fields:
+        return None
+    
+    unknown = set(fields) - SONG_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown song fields: {', '.join(sorted(unknown))}")
+    
+    # createdAt is needed to build the next page cursor
+    projection = {field: 1 for field in fields}
+    projection['createdAt'] = 1
+    return projection
+
+def encode_song_cursor(song):
+    """Opaque keyset cursor for the (createdAt, _id) position of a song"""
+    created_at = song.get('createdAt')
+    payload = {'c': created_at.isoformat() if created_at else None, 'i': str(song['_id'])}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_song_cursor(cursor):
+    """Inverse of encode_song_cursor; raises ValueError on a bad cursor"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(payload['c']) if payload['c'] else None
+        return created_at, ObjectId(payload['i'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def songs_after_cursor(created_at, song_id):
+    """Query for songs after (createdAt, _id) in createdAt DESC, _id DESC order"""
+    if created_at is None:
+        # Already in the undated tail, which sorts last
+        return {'createdAt': None, '_id': {'$lt': song_id}}
+    return {'$or': [
+        {'createdAt': {'$lt': created_at}},
+        {'createdAt': created_at, '_id': {'$lt': song_id}},
+        {'createdAt': None}
+    ]}
+
+def stream_song_list(songs):
+    """Stream a Mongo cursor as a JSON array without building it in memory"""
+    def generate():
+        yield '['
+        for i, song in enumerate(songs):
+            yield (',' if i else '') + app.json.dumps(serialize_song(song))
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def stream_song_page(songs, limit):
+    """Stream one catalog page as {"songs": [...], "nextCursor": ...}"""
+    def generate():
+        yield '{"songs": ['
+        last_song = None
+        next_cursor = None
+        for i, song in enumerate(songs):
+            if i == limit:
+                next_cursor = encode_song_cursor(last_song)
+                break
+            last_song = {'_id': song['_id'], 'createdAt': song.get('createdAt')}
+            yield (',' if i else '') + app.json.dumps(serialize_song(song))
+        yield '], "nextCursor": ' + json.dumps(next_cursor) + '}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def decode_data_url(data_url):
+    """Decode a base64 data URL (or bare base64 string) into raw bytes"""
+    if not isinstance(data_url, str):
+        raise ValueError('Image data must be a string')
+    
+    # "data:image/jpeg;base64,<payload>" -> "<payload>"
+    payload = data_url.split(',', 1)[1] if ',' in data_url else data_url
+    
+    try:
+        return base64.b64decode(payload)
+    except (binascii.Error, ValueError):
+        raise ValueError('Invalid base64 image data')
+
+def read_frame_upload():
+    """Return the uploaded frame (raw body or multipart 'frame') as a memoryview
+
+    The view wraps the bytes read from the request, so cv2.imdecode reads
+    the JPEG/WebP data without another copy.
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('frame') or request.files.get('image')
+        if upload is None:
+            raise ValueError('No frame in multipart upload')
+        return memoryview(upload.read())
+
+    if request.mimetype not in FRAME_CONTENT_TYPES:
+        raise ValueError(f"Unsupported frame content type: {request.mimetype or 'none'}")
+    return memoryview(request.get_data(cache=False))
+
+def parse_face_roi(value):
+    """Client ROI (the previous faceRegion) as {'x','y','w','h'} or "x,y,w,h", or None"""
+    if value in (None, ''):
+        return None
+    try:
+        if isinstance(value, dict):
+            roi = tuple(int(value[key]) for key in ('x', 'y', 'w', 'h'))
+        else:
+            roi = tuple(int(float(v)) for v in str(value).split(','))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('faceRegion must be x, y, w, h')
+    if len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0:
+        raise ValueError('faceRegion must be x, y, w, h')
+    return roi
+
+def add_server_timing(timings):
+    """Send pipeline stage timings as a Server-Timing header (visible in devtools)"""
+    header = ', '.join(f'{stage};dur={ms}' for stage, ms in timings.items())
+
+    @after_this_request
+    def set_server_timing(response):
+        response.headers['Server-Timing'] = header
+        return response
+
+def parse_frame_scale(value):
+    """?scale= of a client-downscaled frame (frame size / video size), in (0, 1]"""
+    if value is None:
+        return 1.0
+    try:
+        scale = float(value)
+    except ValueError:
+        raise ValueError('scale must be a number')
+    if not 0 < scale <= 1:
+        raise ValueError('scale must be in (0, 1]')
+    return scale
+
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
@@ -307,35 +621,52 @@ def allowed_file(filename, file_type='audio'):
         return ext in ALLOWED_IMAGE_EXTENSIONS
     return False
 
-def save_uploaded_file(file, folder):
-    """Upload file to Cloudinary and return the URL"""
-    if not file or not allowed_file(file.filename, 'audio' if folder == 'audio' else 'image'):
-        return None
+def media_job_complete(job):
+    """Point the song at its stored files once a media job has uploaded them"""
+    song = songs_collection.find_one({'_id': ObjectId(job['songId'])})
+    if song is None:
+        return  # Deleted while uploading
     
-    try:
-        # Determine resource type
-        resource_type = 'video' if folder == 'audio' else 'image'  # Cloudinary uses 'video' for audio
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        original_filename = secure_filename(file.filename)
-        filename_without_ext = os.path.splitext(original_filename)[0]
-        public_id = f"vibesync/{folder}/{timestamp}_{filename_without_ext}"
-        
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            file,
-            public_id=public_id,
-            resource_type=resource_type,
-            folder=f"vibesync/{folder}"
-        )
-        
-        # Return the secure URL
-        return upload_result['secure_url']
-        
-    except Exception as e:
-        print(f"❌ Cloudinary upload error: {e}")
-        return None
+    # Leave fields an admin changed in the meantime alone
+    spool_prefix = f"{MEDIA_SPOOL_URL}/{job['id']}/"
+    update = {asset['field']: asset['url'] for asset in job['assets']
+              if str(song.get(asset['field']) or '').startswith(spool_prefix)}
+    if 'renditions' in job and 'audioUrl' in update:
+        update.update(renditions=job['renditions'], audioBitrate=job['audioBitrate'])
+    update.update({'mediaStatus': 'ready', 'updatedAt': datetime.utcnow()})
+    song = songs_collection.find_one_and_update(
+        {'_id': song['_id'], 'mediaJobId': job['id']},
+        {'$set': update},
+        return_document=ReturnDocument.AFTER
+    )
+    if song is not None:
+        song_saved(serialize_song(song))
+
+def media_job_failed(job):
+    """Flag the song when its media job gave up"""
+    songs_collection.update_one(
+        {'_id': ObjectId(job['songId']), 'mediaJobId': job['id']},
+        {'$set': {'mediaStatus': 'failed', 'updatedAt': datetime.utcnow()}}
+    )
+    song_cache.invalidate()
+
+def transcode_audio(path):
+    """Renditions of an uploaded track, stored in the media backend"""
+    return create_renditions(path, media_storage)
+
+# Background uploads for /api/songs/upload; jobs live on disk in MEDIA_SPOOL_DIR
+media_jobs = MediaJobQueue(
+    media_storage,
+    MEDIA_SPOOL_DIR,
+    workers=int(os.getenv('MEDIA_JOB_WORKERS', '2')),
+    max_attempts=int(os.getenv('MEDIA_JOB_MAX_ATTEMPTS', '5')),
+    retry_seconds=float(os.getenv('MEDIA_JOB_RETRY_SECONDS', '2')),
+    rescan_interval=float(os.getenv('MEDIA_JOB_RESCAN_SECONDS', '60')),
+    retention_hours=float(os.getenv('MEDIA_JOB_RETENTION_HOURS', '24')),
+    on_complete=media_job_complete,
+    on_failed=media_job_failed,
+    transcode=transcode_audio if transcoding_enabled() else None
+)
 
 # ============================================================
 # AUTHENTICATION ROUTES (Update all queries)
@@ -521,6 +852,15 @@ def get_current_user():
         'lastLogin': user['last_login'].isoformat() if user['last_login'] else None
     }), 200
 
+@app.route('/health/models', methods=['GET'])
+def models_health():
+    """Readiness of the face detector and emotion model, with load stats"""
+    if not ENABLE_EMOTION_DETECTION:
+        return jsonify({'ready': False, 'mode': 'disabled'}), 200
+    
+    status = inference_backend.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
 # ============================================================
 # MAIN ROUTES (Keep as is - no database calls here)
 # ============================================================
@@ -573,176 +913,166 @@ def playlist_page():
 # EMOTION DETECTION
 # ============================================================
 
+def emotion_detection_disabled():
+    return jsonify({
+        'success': False,
+        'message': 'Emotion detection is disabled',
+        'showFallback': True
+    }), 503
+
+def inference_unavailable():
+    return jsonify({
+        'success': False,
+        'message': 'Emotion detection is busy, try again shortly',
+        'showFallback': True
+    }), 503
+
+def no_face_detected():
+    return jsonify({
+        'success': False,
+        'message': '😕 No face detected',
+        'showFallback': True
+    }), 200
+
+def run_emotion_detection(user_id, image, scale=1.0, roi=None):
+    """Analyze one encoded frame for the user and build the /detect_emotion response
+
+    `scale` is the client's downscale factor; the face box and landmarks
+    are mapped back to full-size video coordinates. `roi` (video
+    coordinates) limits face detection to a window around it.
+    """
+    if roi is not None and scale != 1.0:
+        roi = tuple(int(v * scale) for v in roi)
+    
+    # Analyze in memory (no temp files); a frame that looks like the
+    # user's last one is not re-analyzed
+    analysis = inference_backend.analyze(image, emotion_tracker.reusable_signature(user_id), roi)
+    add_server_timing(analysis['timings'])
+    
+    if analysis.get('unchanged'):
+        previous_response = emotion_tracker.reuse(user_id)
+        if previous_response is not None:
+            return jsonify(dict(previous_response, reused=True)), 200
+        analysis = inference_backend.analyze(image, None, roi)
+        add_server_timing(analysis['timings'])
+    
+    if analysis['face'] is None:
+        emotion_tracker.record(user_id, analysis['signature'], None, None)
+        return no_face_detected()
+    
+    # Every detected face in full-size video coordinates; the first one
+    # (largest) drives the emotion and the overlay
+    boxes = np.rint(np.asarray(analysis.get('faces') or [analysis['face']], dtype=np.float64) / scale).astype(int)
+    x, y, w, h = (int(v) for v in boxes[0])
+    face_region = {'x': x, 'y': y, 'w': w, 'h': h}
+    
+    # Stylish 68-point landmarks for all faces in one vectorized transform
+    face_landmarks = landmarks_for_faces(boxes)
+    landmarks = landmarks_as_dicts(face_landmarks[0])
+    
+    # Smooth the scores over time so the reported mood is stable
+    emotion_scores = emotion_tracker.smooth(user_id, analysis['scores'])
+    dominant_emotion = max(emotion_scores, key=emotion_scores.get)
+    confidence = float(emotion_scores[dominant_emotion])
+    
+    print(f"🎭 {session['email']} - Detected: {dominant_emotion} ({confidence:.1f}%)")
+    
+    # Save to history (buffered, written in the next batch)
+    history_writer.enqueue('emotion_history', {
+        'user_id': user_id,
+        'email': session['email'],
+        'emotion': dominant_emotion,
+        'confidence': confidence
+    })
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    recent_song_ids = get_recent_song_ids(cursor, user_id)
+    cursor.close()
+    conn.close()
+
+    # Recommend songs for the whole mood vector, skipping recent plays
+    songs = get_emotion_index().recommend(emotion_scores, k=10, exclude=recent_song_ids)
+    
+    emotion_mapping = {
+        'angry': 'Angry', 'disgust': 'Disgust', 'fear': 'Fear',
+        'happy': 'Happy', 'sad': 'Sad', 'surprise': 'Surprise', 'neutral': 'Neutral'
+    }
+    
+    display_emotion = emotion_mapping.get(dominant_emotion, 'Neutral')
+    
+    response = {
+        'success': True,
+        'emotion': display_emotion,
+        'confidence': round(confidence, 2),
+        'probabilities': emotion_scores,
+        'songs': songs,
+        'faceRegion': face_region,
+        'landmarks': landmarks,  # ← THIS IS THE KEY!
+        'landmarksFlat': face_landmarks[0].ravel().tolist(),  # [x0, y0, x1, y1, ...]
+        'faces': [
+            {'faceRegion': dict(zip('xywh', box)), 'landmarksFlat': points.ravel().tolist()}
+            for box, points in zip(boxes.tolist(), face_landmarks)
+        ],
+        'message': f'🎭 Mood: {display_emotion}!'
+    }
+    emotion_tracker.record(user_id, analysis['signature'], emotion_scores, response)
+    
+    return jsonify(dict(response, reused=False)), 200
+
 @app.route('/detect_emotion', methods=['POST'])
 @login_required
 def detect_emotion():
+    """Analyze a webcam frame sent as a base64 data URL in JSON"""
+    if not ENABLE_EMOTION_DETECTION:
+        return emotion_detection_disabled()
+    
     try:
         data = request.get_json()
         if not data or 'image' not in data:
             return jsonify({'success': False, 'message': 'No image data'}), 400
         
-        # Decode base64 image
-        image_data = data['image'].split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        image_np = np.array(image)
-        
-        # Convert to BGR
-        if len(image_np.shape) == 3:
-            if image_np.shape[2] == 4:
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_RGBA2BGR)
-            else:
-                image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-        
-        # Save temp image
-        temp_path = 'temp_frame.jpg'
-        cv2.imwrite(temp_path, image_np)
-        
-        # Detect face first with OpenCV for landmarks
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-        
-        if len(faces) == 0:
-            return jsonify({
-                'success': False,
-                'message': '😕 No face detected',
-                'showFallback': True
-            }), 200
-        
-        # Get the first (largest) face
-        x, y, w, h = faces[0]
-        face_region = {'x': int(x), 'y': int(y), 'w': int(w), 'h': int(h)}
-        
-        # Generate stylish landmark points (68 facial landmarks simulation)
-        landmarks = []
-        
-        # Face outline (17 points - 0 to 16)
-        for i in range(17):
-            angle = (i / 16.0) * np.pi
-            lx = int(x + w/2 + (w/2.2) * np.cos(angle + np.pi))
-            ly = int(y + h/2 + (h/1.5) * np.sin(angle + np.pi/6))
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Left eyebrow (5 points - 17 to 21)
-        for i in range(5):
-            lx = int(x + w * (0.25 + i * 0.05))
-            ly = int(y + h * 0.3)
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Right eyebrow (5 points - 22 to 26)
-        for i in range(5):
-            lx = int(x + w * (0.55 + i * 0.05))
-            ly = int(y + h * 0.3)
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Nose bridge (4 points - 27 to 30)
-        for i in range(4):
-            lx = int(x + w/2)
-            ly = int(y + h * (0.35 + i * 0.08))
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Nose base (5 points - 31 to 35)
-        for i in range(5):
-            lx = int(x + w * (0.35 + i * 0.075))
-            ly = int(y + h * 0.6)
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Left eye (6 points - 36 to 41)
-        eye_center_x = x + int(w * 0.3)
-        eye_center_y = y + int(h * 0.4)
-        for i in range(6):
-            angle = (i / 6.0) * 2 * np.pi
-            lx = int(eye_center_x + (w * 0.05) * np.cos(angle))
-            ly = int(eye_center_y + (h * 0.03) * np.sin(angle))
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Right eye (6 points - 42 to 47)
-        eye_center_x = x + int(w * 0.7)
-        for i in range(6):
-            angle = (i / 6.0) * 2 * np.pi
-            lx = int(eye_center_x + (w * 0.05) * np.cos(angle))
-            ly = int(eye_center_y + (h * 0.03) * np.sin(angle))
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Outer mouth (12 points - 48 to 59)
-        mouth_center_x = x + int(w/2)
-        mouth_center_y = y + int(h * 0.75)
-        for i in range(12):
-            angle = (i / 12.0) * 2 * np.pi
-            lx = int(mouth_center_x + (w * 0.15) * np.cos(angle))
-            ly = int(mouth_center_y + (h * 0.06) * np.sin(angle))
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Inner mouth (8 points - 60 to 67)
-        for i in range(8):
-            angle = (i / 8.0) * 2 * np.pi
-            lx = int(mouth_center_x + (w * 0.1) * np.cos(angle))
-            ly = int(mouth_center_y + (h * 0.04) * np.sin(angle))
-            landmarks.append({'x': lx, 'y': ly})
-        
-        # Now analyze emotion with DeepFace
-        result = DeepFace.analyze(
-            img_path=temp_path,
-            actions=['emotion'],
-            enforce_detection=False,
-            detector_backend='opencv'
-        )
-        
-        if isinstance(result, list):
-            result = result[0]
-        
-        dominant_emotion = result['dominant_emotion']
-        emotion_scores = {k: float(v) for k, v in result['emotion'].items()}
-        confidence = float(emotion_scores[dominant_emotion])
-        
-        print(f"🎭 {session['email']} - Detected: {dominant_emotion} ({confidence:.1f}%)")
-        
-        # Save to history (PostgreSQL - FIXED)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO emotion_history (user_id, email, emotion, confidence)
-            VALUES (%s, %s, %s, %s)
-        ''', (session['user_id'], session['email'], dominant_emotion, confidence))
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        # Get songs from MongoDB
-        songs = list(songs_collection.find({
-            'emotions': {'$in': [dominant_emotion.lower()]}
-        }).limit(10))
-        songs = [serialize_song(song) for song in songs]
-        
-        emotion_mapping = {
-            'angry': 'Angry', 'disgust': 'Disgust', 'fear': 'Fear',
-            'happy': 'Happy', 'sad': 'Sad', 'surprise': 'Surprise', 'neutral': 'Neutral'
-        }
-        
-        display_emotion = emotion_mapping.get(dominant_emotion, 'Neutral')
-        
-        return jsonify({
-            'success': True,
-            'emotion': display_emotion,
-            'confidence': round(confidence, 2),
-            'probabilities': emotion_scores,
-            'songs': songs,
-            'faceRegion': face_region,
-            'landmarks': landmarks,  # ← THIS IS THE KEY!
-            'message': f'🎭 Mood: {display_emotion}!'
-        }), 200
+        return run_emotion_detection(session['user_id'], decode_data_url(data['image']),
+                                     roi=parse_face_roi(data.get('faceRegion')))
         
+    except InferenceTimeout as e:
+        print(f"⚠️ {e}")
+        return inference_unavailable()
     except Exception as e:
         print(f"Error: {str(e)}")
-        return jsonify({
-            'success': False,
-            'message': '😕 No face detected',
-            'showFallback': True
-        }), 200
+        return no_face_detected()
+
+@app.route('/detect_emotion/frame', methods=['POST'])
+@login_required
+def detect_emotion_frame():
+    """Analyze a webcam frame sent as raw JPEG/WebP bytes (body or multipart 'frame')
+
+    Skips the base64 data URL of /detect_emotion (a third smaller upload and
+    no decode copy). Clients may send a downscaled frame with ?scale= and
+    the previous faceRegion as ?roi=x,y,w,h.
+    """
+    if not ENABLE_EMOTION_DETECTION:
+        return emotion_detection_disabled()
+    
+    if request.content_length and request.content_length > MAX_FRAME_BYTES:
+        return jsonify({'success': False, 'message': 'Frame too large'}), 413
+    
+    try:
+        image = read_frame_upload()
+        scale = parse_frame_scale(request.args.get('scale'))
+        roi = parse_face_roi(request.args.get('roi'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        return run_emotion_detection(session['user_id'], image, scale, roi)
         
+    except InferenceTimeout as e:
+        print(f"⚠️ {e}")
+        return inference_unavailable()
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+        print(f"Error: {str(e)}")
+        return no_face_detected()
 
 
 # ============================================================
@@ -763,17 +1093,14 @@ def add_recently_played():
         if not all([song_id, song_title, artist]):
             return jsonify({'error': 'Missing song data'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO recently_played (user_id, email, song_id, song_title, artist)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (session['user_id'], session['email'], song_id, song_title, artist))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Buffered; written with the next batch
+        history_writer.enqueue('recently_played', {
+            'user_id': session['user_id'],
+            'email': session['email'],
+            'song_id': song_id,
+            'song_title': song_title,
+            'artist': artist
+        })
         
         return jsonify({'success': True}), 201
         
@@ -785,6 +1112,8 @@ def add_recently_played():
 def get_recently_played():
     """Get user's recently played songs with cover images from MongoDB"""
     try:
+        history_writer.flush()  # Include rows still in the write-behind buffer
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -800,26 +1129,23 @@ def get_recently_played():
         cursor.close()
         conn.close()
         
+        # ✅ Get FULL song details from MongoDB in one round-trip
+        try:
+            song_docs = fetch_songs_by_ids([row['song_id'] for row in rows])
+        except Exception as e:
+            print(f"Error fetching recently played songs from MongoDB: {e}")
+            song_docs = {}
+        
         history = []
         for row in rows:
             song_id = row['song_id']
+            song_doc = song_docs.get(song_id)
             
-            # ✅ Get FULL song details from MongoDB
-            try:
-                from bson import ObjectId
-                song_doc = songs_collection.find_one({'_id': ObjectId(song_id)})
-                
-                if song_doc:
-                    cover_url = song_doc.get('coverUrl', f'https://picsum.photos/400/400?random={song_id}')
-                    audio_url = song_doc.get('audioUrl', 'https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3')
-                    artist_photo = song_doc.get('artistPhotoUrl', '')
-                else:
-                    cover_url = f'https://picsum.photos/400/400?random={song_id}'
-                    audio_url = 'https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3'
-                    artist_photo = ''
-                    
-            except Exception as e:
-                print(f"Error fetching song {song_id} from MongoDB: {e}")
+            if song_doc:
+                cover_url = song_doc.get('coverUrl', f'https://picsum.photos/400/400?random={song_id}')
+                audio_url = song_doc.get('audioUrl', 'https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3')
+                artist_photo = song_doc.get('artistPhotoUrl', '')
+            else:
                 cover_url = f'https://picsum.photos/400/400?random={song_id}'
                 audio_url = 'https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3'
                 artist_photo = ''
@@ -846,6 +1172,8 @@ def get_recently_played():
 def get_emotion_history():
     """Get user's emotion detection history"""
     try:
+        history_writer.flush()  # Include rows still in the write-behind buffer
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -880,22 +1208,62 @@ def get_emotion_history():
 @app.route('/api/songs', methods=['GET'])
 @login_required
 def get_all_songs():
-    """Get all songs from MongoDB"""
+    """Get songs from MongoDB, newest first, one page at a time
+    
+    Query params:
+      limit   page size (default 50, max 200)
+      cursor  nextCursor from the previous page
+      fields  comma-separated fields to return (default: all)
+      q       case-insensitive substring of the title or artist
+      language  only songs in this language
+      all     'true' returns the whole catalog as a plain list (legacy)
+    
+    Paginated responses look like {"songs": [...], "nextCursor": "..." | null}.
+    """
     try:
-        songs = list(songs_collection.find().sort('createdAt', -1))
-        songs = [serialize_song(song) for song in songs]
-        return jsonify(songs), 200
+        projection = parse_song_fields(request.args.get('fields', ''))
+        
+        filters = {}
+        language = request.args.get('language', '').strip()
+        if language:
+            filters['language'] = language
+        search = request.args.get('q', '').strip()[:SONG_SEARCH_MAX_LENGTH]
+        if search:
+            pattern = {'$regex': re.escape(search), '$options': 'i'}
+            filters['$or'] = [{'title': pattern}, {'artist': pattern}]
+        
+        if request.args.get('all', '').lower() == 'true':
+            songs = find_songs_cached(filters, projection, sort=SONG_CATALOG_SORT)
+            return stream_song_list(songs)
+        
+        limit = min(max(request.args.get('limit', SONG_PAGE_SIZE, type=int), 1), SONG_PAGE_SIZE_MAX)
+        query = filters
+        cursor = request.args.get('cursor')
+        if cursor:
+            after = songs_after_cursor(*decode_song_cursor(cursor))
+            query = {'$and': [filters, after]} if filters else after
+        
+        # One extra document tells us whether there is a next page
+        songs = find_songs_cached(query, projection, sort=SONG_CATALOG_SORT, limit=limit + 1)
+        return stream_song_page(songs, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/songs/by-emotion', methods=['GET'])
 @login_required
 def get_songs_by_emotion():
-    """Get songs matching a specific emotion"""
+    """Get songs matching a specific emotion
+    
+    ?emotion=Happy for one emotion, or ?weights=happy:70,neutral:30 to mix
+    several (e.g. the probabilities from /detect_emotion).
+    """
     try:
         emotion = request.args.get('emotion', '').strip()
+        weights_param = request.args.get('weights', '').strip()
         
-        if not emotion:
+        if not emotion and not weights_param:
             return jsonify({'error': 'Emotion parameter required'}), 400
         
         # Map display emotion names to lowercase for database query
@@ -909,14 +1277,22 @@ def get_songs_by_emotion():
             'Neutral': 'neutral'
         }
         
-        emotion_lower = emotion_mapping.get(emotion, emotion.lower())
+        if weights_param:
+            try:
+                weights = parse_emotion_weights(weights_param)
+            except ValueError:
+                return jsonify({'error': 'Invalid weights parameter'}), 400
+        else:
+            weights = {emotion_mapping.get(emotion, emotion.lower()): 1.0}
         
-        # Get songs from MongoDB that match the emotion
-        songs = list(songs_collection.find({
-            'emotions': {'$in': [emotion_lower]}
-        }).limit(20))
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        recent_song_ids = get_recent_song_ids(cursor, session['user_id'])
+        cursor.close()
+        conn.close()
         
-        songs = [serialize_song(song) for song in songs]
+        # Pick matching songs from the in-memory emotion index
+        songs = get_emotion_index().recommend(weights, k=20, exclude=recent_song_ids)
         
         return jsonify(songs), 200
         
@@ -947,62 +1323,164 @@ def upload_song():
         if len(emotions) == 0:
             return jsonify({'error': 'At least one emotion required'}), 400
         
-        # Handle audio file or URL
-        audio_url = ''
-        if 'audioFile' in request.files:
-            audio_file = request.files['audioFile']
-            if audio_file.filename:
-                audio_url = save_uploaded_file(audio_file, 'audio')
-                if not audio_url:
-                    return jsonify({'error': 'Invalid audio file format'}), 400
-        else:
-            audio_url = request.form.get('audioUrl', '')
-        
-        # Handle cover image file or URL
-        cover_url = ''
-        if 'coverFile' in request.files:
-            cover_file = request.files['coverFile']
-            if cover_file.filename:
-                cover_url = save_uploaded_file(cover_file, 'covers')
-                if not cover_url:
-                    return jsonify({'error': 'Invalid image file format'}), 400
-        else:
-            cover_url = request.form.get('coverUrl', f'https://picsum.photos/400/400?random={datetime.now().timestamp()}')
-        
-        # Handle artist photo file or URL
-        artist_photo_url = ''
-        if 'artistPhotoFile' in request.files:
-            artist_photo_file = request.files['artistPhotoFile']
-            if artist_photo_file.filename:
-                artist_photo_url = save_uploaded_file(artist_photo_file, 'artists')
-        else:
-            artist_photo_url = request.form.get('artistPhotoUrl', '')
+        # Files are checked here, spooled to disk and stored by a media job;
+        # fields sent without a file input keep their URL
+        song = {
+            'coverUrl': '' if 'coverFile' in request.files else request.form.get(
+                'coverUrl', f'https://picsum.photos/400/400?random={datetime.now().timestamp()}'),
+            'audioUrl': '' if 'audioFile' in request.files else request.form.get('audioUrl', ''),
+            'artistPhotoUrl': '' if 'artistPhotoFile' in request.files else request.form.get('artistPhotoUrl', '')
+        }
+        
+        files = []
+        for field, input_name, folder, file_type, error in (
+            ('audioUrl', 'audioFile', 'audio', 'audio', 'Invalid audio file format'),
+            ('coverUrl', 'coverFile', 'covers', 'image', 'Invalid image file format'),
+            ('artistPhotoUrl', 'artistPhotoFile', 'artists', 'image', None)  # Optional: bad files are ignored
+        ):
+            file = request.files.get(input_name)
+            if not file or not file.filename:
+                continue
+            if allowed_file(file.filename, file_type):
+                files.append((field, file, folder))
+            elif error:
+                return jsonify({'error': error}), 400
         
         # Create song document
-        song = {
+        song.update({
             'title': title,
             'artist': artist,
-            'coverUrl': cover_url,
-            'audioUrl': audio_url,
-            'artistPhotoUrl': artist_photo_url,
             'emotions': [e.lower() for e in emotions],
             'language': language,
             'createdAt': datetime.utcnow(),
             'updatedAt': datetime.utcnow(),
             'uploadedBy': session['email']
-        }
+        })
+        
+        job_id = None
+        if files:
+            # Until the job finishes, the song plays from the spooled copies
+            job_id = media_jobs.new_job_id()
+            try:
+                assets = [media_jobs.spool(job_id, file, field, folder) for field, file, folder in files]
+                for asset in assets:
+                    song[asset['field']] = f"{MEDIA_SPOOL_URL}/{job_id}/{asset['file']}"
+                song.update({'mediaStatus': 'pending', 'mediaJobId': job_id})
+                result = songs_collection.insert_one(song)
+            except Exception:
+                media_jobs.discard(job_id)
+                raise
+        else:
+            result = songs_collection.insert_one(song)
         
-        result = songs_collection.insert_one(song)
         song['_id'] = str(result.inserted_id)
+        song_saved(song)
         
         print(f"✓ Song added by {session['email']}: {song['title']}")
         
+        if job_id:
+            media_jobs.submit(job_id, song['_id'], assets)
+            return jsonify({'success': True, 'song': song, 'jobId': job_id}), 202
         return jsonify({'success': True, 'song': song}), 201
         
     except Exception as e:
         print(f"Error uploading song: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/songs/import', methods=['POST'])
+@admin_required
+def import_songs():
+    """Start or resume a bulk import (admin only)
+
+    Multipart form: manifest (.csv/.jsonl) plus either archive (.zip/.tar/
+    .tar.gz with the files the manifest names) or mediaDir, a directory under
+    SONG_IMPORT_MEDIA_ROOT. Runs in the background; poll the returned importId.
+    """
+    try:
+        manifest = request.files.get('manifest')
+        if manifest is None or not manifest.filename:
+            return jsonify({'error': 'Manifest file required'}), 400
+        
+        try:
+            import_id = prepare_import(
+                manifest,
+                media_root=SONG_IMPORT_MEDIA_ROOT,
+                media_dir=request.form.get('mediaDir', '').strip(),
+                archive_file=request.files.get('archive')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        job = SongImport(
+            import_id,
+            songs_collection,
+            media_storage.save,
+            {'audio': ALLOWED_AUDIO_EXTENSIONS, 'covers': ALLOWED_IMAGE_EXTENSIONS, 'artists': ALLOWED_IMAGE_EXTENSIONS},
+            uploaded_by=session['email'],
+            on_inserted=songs_imported,
+            transcode=transcode_audio if transcoding_enabled() else None
+        )
+        job.start()
+        
+        print(f"✓ Song import {import_id} started by {session['email']}")
+        return jsonify({'success': True, 'importId': import_id}), 202
+        
+    except Exception as e:
+        print(f"Error starting song import: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/songs/import/<import_id>', methods=['GET'])
+@admin_required
+def get_song_import(import_id):
+    """Progress of a bulk import (admin only)"""
+    progress = read_progress(import_id)
+    if progress is None:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(progress), 200
+
+@app.route('/api/media/jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_media_job(job_id):
+    """Status of a background media upload (admin only)"""
+    job = media_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+@app.route('/api/media/jobs/<job_id>/retry', methods=['POST'])
+@admin_required
+def retry_media_job(job_id):
+    """Queue a failed media upload again (admin only)"""
+    try:
+        job = media_jobs.retry(job_id)
+        if job is None:
+            return jsonify({'error': 'No failed job with that ID'}), 404
+        songs_collection.update_one(
+            {'_id': ObjectId(job['songId']), 'mediaJobId': job_id},
+            {'$set': {'mediaStatus': 'pending', 'updatedAt': datetime.utcnow()}}
+        )
+        song_cache.invalidate()
+        return jsonify({'success': True, 'job': job}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route(f'{MEDIA_SPOOL_URL}/<job_id>/<filename>')
+@login_required
+def spooled_media(job_id, filename):
+    """Serve an uploaded file while its media job is still storing it"""
+    path = media_jobs.spooled_path(job_id, filename)
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+    return send_file(path, conditional=True, max_age=60)
+
+@app.route('/media/<path:name>', methods=['GET'])
+def local_media(name):
+    """Stream a file from the local media backend (Range, ETag, long-lived caching)"""
+    response = media_storage.serve(request.environ, name) if media_storage.name == 'local' else None
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+    return response
+
 @app.route('/api/songs', methods=['POST'])
 @admin_required
 def add_song():
@@ -1031,6 +1509,7 @@ def add_song():
         
         result = songs_collection.insert_one(song)
         song['_id'] = str(result.inserted_id)
+        song_saved(song)
         
         print(f"✓ Song added by {session['email']}: {song['title']}")
         
@@ -1050,11 +1529,9 @@ def get_songs_by_language():
             return jsonify({'error': 'Language parameter required'}), 400
         
         # Get songs from MongoDB that match the language
-        songs = list(songs_collection.find({
+        songs = find_songs_cached({
             'language': language
-        }).sort('createdAt', -1))
-        
-        songs = [serialize_song(song) for song in songs]
+        }, sort=[('createdAt', -1)])
         
         return jsonify(songs), 200
         
@@ -1066,12 +1543,11 @@ def get_songs_by_language():
 def get_available_languages():
     """Get list of all available languages"""
     try:
-        # Get distinct languages from MongoDB
-        languages = songs_collection.distinct('language')
-        
-        # Filter out None/empty and sort
-        languages = [lang for lang in languages if lang]
-        languages.sort()
+        # Get distinct languages from MongoDB (cached), without None/empty, sorted
+        languages = song_cache.get_or_load(
+            ('languages',),
+            lambda: sorted(lang for lang in songs_collection.distinct('language') if lang)
+        )
         
         return jsonify(languages), 200
         
@@ -1093,6 +1569,7 @@ def delete_song(song_id):
         result = songs_collection.delete_one({'_id': ObjectId(song_id)})
         if result.deleted_count == 0:
             return jsonify({'error': 'Song not found'}), 404
+        song_deleted(song_id)
         
         print(f"✓ Song deleted by {session['email']}: {song_id}")
         return jsonify({'success': True}), 200
@@ -1125,17 +1602,24 @@ def update_song(song_id):
             update_data['coverUrl'] = data['coverUrl']
         if data.get('artistPhotoUrl'):
             update_data['artistPhotoUrl'] = data['artistPhotoUrl']
+        update = {'$set': update_data}
         if data.get('audioUrl'):
             update_data['audioUrl'] = data['audioUrl']
+            current = songs_collection.find_one({'_id': ObjectId(song_id)}, {'audioUrl': 1})
+            if current and current.get('audioUrl') != data['audioUrl']:
+                # Renditions of the replaced track would keep playing otherwise
+                update['$unset'] = {'renditions': '', 'audioBitrate': ''}
         
         # Update in MongoDB
-        result = songs_collection.update_one(
+        song = songs_collection.find_one_and_update(
             {'_id': ObjectId(song_id)},
-            {'$set': update_data}
+            update,
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.matched_count == 0:
+        if song is None:
             return jsonify({'error': 'Song not found'}), 404
+        song_saved(serialize_song(song))
         
         print(f"✓ Song updated by {session['email']}: {data['title']}")
         
@@ -1148,28 +1632,127 @@ def update_song(song_id):
         print(f"Error updating song: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/songs/<song_id>/stream', methods=['GET'])
+@login_required
+def stream_song(song_id):
+    """Pick the audio rendition that suits the listener's connection
+    
+    Hints come from ?network= (effectiveType: slow-2g/2g/3g/4g, or wifi/
+    ethernet), ?downlink= (Mbps) and ?saveData=1, falling back to the ECT,
+    Downlink and Save-Data client hint headers. Returns {url, bitrate,
+    renditions}, or redirects to the chosen file with ?redirect=1 (for use
+    as an <audio> src).
+    """
+    try:
+        network = (request.args.get('network') or request.headers.get('ECT') or '').strip().lower() or None
+        try:
+            downlink = float(request.args.get('downlink') or request.headers.get('Downlink') or 0)
+        except ValueError:
+            return jsonify({'error': 'downlink must be a number'}), 400
+        save_data = (request.args.get('saveData') or request.headers.get('Save-Data') or '').lower() in ('1', 'true', 'on')
+        
+        song = fetch_songs_by_ids([song_id]).get(song_id)
+        if song is None:
+            return jsonify({'error': 'Song not found'}), 404
+        
+        choice = pick_rendition(song, bitrate_budget(network, downlink, save_data))
+        if choice is None:
+            return jsonify({'error': 'Song has no audio'}), 404
+        
+        if request.args.get('redirect') in ('1', 'true'):
+            response = redirect(choice['url'], 302)
+        else:
+            response = jsonify({
+                'url': choice['url'],
+                'bitrate': choice['bitrate'],
+                'codec': choice['codec'],
+                'original': choice['original'],
+                'renditions': [r['bitrate'] for r in song.get('renditions') or []]
+            })
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['Vary'] = 'ECT, Downlink, Save-Data'
+        return response
+        
+    except Exception as e:
+        print(f"Error picking song rendition: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # ============================================================
 # ADMIN ROUTES - USER MANAGEMENT (SQLite)
 # ============================================================
 
+def escape_like(value):
+    """Escape LIKE wildcards so user input matches literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def get_all_users():
-    """Get all users (admin only)"""
+    """Get users (admin only), newest first, one page at a time
+    
+    Query params:
+      limit   page size (default 50, max 200)
+      cursor  nextCursor from the previous page
+      q       case-insensitive prefix of the email, first name, last name
+              or "first last"
+      status  'active' or 'inactive'
+      role    'admin' or 'user'
+    
+    Responses look like {"users": [...], "nextCursor": "..." | null}.
+    """
     try:
+        limit = min(max(request.args.get('limit', USER_PAGE_SIZE, type=int), 1), USER_PAGE_SIZE_MAX)
+        conditions = []
+        params = {'limit': limit + 1}
+        
+        cursor_id = request.args.get('cursor')
+        if cursor_id:
+            if not cursor_id.isdigit():
+                return jsonify({'error': 'Invalid cursor'}), 400
+            conditions.append('id < %(cursor)s')
+            params['cursor'] = int(cursor_id)
+        
+        search = request.args.get('q', '').strip().lower()
+        if search:
+            # Each branch can use its lower(...) text_pattern_ops index
+            matches = ['lower(email) LIKE %(prefix)s', 'lower(first_name) LIKE %(prefix)s',
+                       'lower(last_name) LIKE %(prefix)s']
+            params['prefix'] = escape_like(search) + '%'
+            first, _, rest = search.partition(' ')
+            if rest.strip():
+                # "john sm" -> first name john, last name starting with sm
+                matches.append('(lower(first_name) = %(first)s AND lower(last_name) LIKE %(rest)s)')
+                params.update(first=first, rest=escape_like(rest.strip()) + '%')
+            conditions.append('(' + ' OR '.join(matches) + ')')
+        
+        status = request.args.get('status')
+        if status in ('active', 'inactive'):
+            conditions.append('is_active = %(active)s')
+            params['active'] = status == 'active'
+        
+        role = request.args.get('role')
+        if role in ('admin', 'user'):
+            conditions.append('is_admin' if role == 'admin' else 'NOT is_admin')
+        
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        # Keyset paging on the primary key: ids grow with created_at
+        cursor.execute(f'''
             SELECT id, first_name, last_name, email, is_admin, is_active, 
                    created_at, last_login
             FROM users
-            ORDER BY created_at DESC
-        ''')
+            {where}
+            ORDER BY id DESC
+            LIMIT %(limit)s
+        ''', params)
         
         rows = cursor.fetchall()
         conn.close()
         
+        next_cursor = str(rows[limit - 1]['id']) if len(rows) > limit else None
         users = [{
             'id': row['id'],
             'firstName': row['first_name'],
@@ -1179,9 +1762,9 @@ def get_all_users():
             'isActive': bool(row['is_active']),
             'createdAt': row['created_at'],
             'lastLogin': row['last_login']
-        } for row in rows]
+        } for row in rows[:limit]]
         
-        return jsonify(users), 200
+        return jsonify({'users': users, 'nextCursor': next_cursor}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1216,50 +1799,80 @@ def toggle_user_status(user_id):
 @app.route('/api/admin/stats', methods=['GET'])
 @admin_required
 def get_admin_stats():
-    """Get admin dashboard statistics"""
+    """Get admin dashboard statistics
+    
+    ?mode=counters|estimate|exact overrides ADMIN_STATS_MODE; refreshedAt
+    tells how current the figures are.
+    """
     try:
+        mode = request.args.get('mode', ADMIN_STATS_MODE).lower()
+        if mode not in STATS_MODES:
+            return jsonify({'error': f"mode must be one of {', '.join(STATS_MODES)}"}), 400
+        
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # Total users
-        cursor.execute('SELECT COUNT(*) as count FROM users')
-        total_users = cursor.fetchone()['count']
-        
-        # Active users
-        cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_active = TRUE')
-        active_users = cursor.fetchone()['count']
-        
-        # Total plays
-        cursor.execute('SELECT COUNT(*) as count FROM recently_played')
-        total_plays = cursor.fetchone()['count']
-        
-        # Total emotions detected
-        cursor.execute('SELECT COUNT(*) as count FROM emotion_history')
-        total_emotions = cursor.fetchone()['count']
-        
+        counts, refreshed_at = read_stats(cursor, mode)
         cursor.close()
         conn.close()
         
-        # Total songs from MongoDB
-        total_songs = songs_collection.count_documents({})
+        # Total songs from MongoDB (collection metadata unless exact)
+        if mode == 'exact':
+            total_songs = songs_collection.count_documents({})
+        else:
+            total_songs = songs_collection.estimated_document_count()
         
         return jsonify({
-            'totalUsers': total_users,
-            'activeUsers': active_users,
+            'totalUsers': counts.get('users', 0),
+            'activeUsers': counts.get('active_users', 0),
             'totalSongs': total_songs,
-            'totalPlays': total_plays,
-            'totalEmotions': total_emotions
+            'totalPlays': counts.get('plays', 0),
+            'totalEmotions': counts.get('emotions', 0),
+            'mode': mode,
+            'refreshedAt': refreshed_at.isoformat() if refreshed_at else None
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/maintenance/history', methods=['POST'])
+@admin_required
+def run_history_maintenance_now():
+    """Roll up and drop expired history partitions, create upcoming ones (admin only)"""
+    try:
+        history_writer.flush()
+        with db_pool.connection() as conn:
+            summary = run_history_maintenance(conn)
+        print(f"✓ History maintenance by {session['email']}: {summary}")
+        return jsonify({'success': True, 'tables': summary}), 200
+        
+    except Exception as e:
+        print(f"Error running history maintenance: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/metrics', methods=['GET'])
+@admin_required
+def get_admin_metrics():
+    """Get runtime metrics for this worker process (admin only)"""
+    return jsonify({
+        'pid': os.getpid(),
+        'postgresPool': db_pool.metrics(),
+        'songCache': song_cache.stats(),
+        'favoritesCache': favorites_cache.stats(),
+        'emotionIndex': emotion_index.stats(),
+        'emotionFrames': emotion_tracker.stats(),
+        'writeBehind': history_writer.stats(),
+        'mediaJobs': media_jobs.stats(),
+        'mediaStorage': media_storage.stats(),
+        'inference': inference_backend.timings.stats() if inference_backend else None
+    }), 200
+
 @app.route('/api/admin/users/<int:user_id>/emotion-history', methods=['GET'])
 @admin_required
 def get_user_emotion_history(user_id):
     """Get user's emotion detection history (admin only)"""
     try:
         limit = request.args.get('limit', 50, type=int)
+        history_writer.flush()  # Include rows still in the write-behind buffer
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1292,6 +1905,7 @@ def get_user_recently_played(user_id):
     """Get user's recently played songs (admin only)"""
     try:
         limit = request.args.get('limit', 50, type=int)
+        history_writer.flush()  # Include rows still in the write-behind buffer
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1322,57 +1936,83 @@ def get_user_recently_played(user_id):
 @app.route('/api/admin/users/<int:user_id>/activity-charts', methods=['GET'])
 @admin_required
 def get_user_activity_charts(user_id):
-    """Get user activity data for charts (admin only)"""
+    """Get user activity data for charts (admin only)
+    
+    ?period=weekly|monthly picks 7 or 30 days; ?days=N (1-366) asks for
+    an arbitrary range ending today.
+    """
     try:
         period = request.args.get('period', 'weekly')  # 'weekly' or 'monthly'
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         from datetime import datetime, timedelta
         
         # Calculate date range
-        if period == 'weekly':
+        days = request.args.get('days', type=int)
+        if days:
+            days = min(max(days, 1), MAX_CHART_DAYS)
+        elif period == 'weekly':
             days = 7
-            date_format = '%a'  # Day of week (Mon, Tue, etc)
         else:  # monthly
             days = 30
-            date_format = '%b %d'  # Month Day (Jan 01, Jan 02, etc)
         
-        # Generate labels (last N days)
-        labels = []
-        dates = []
+        # Day of week (Mon, Tue, etc) for a week, Month Day (Jan 01, ...) otherwise
+        date_format = '%a' if days <= 7 else '%b %d'
+        
         today = datetime.now().date()
+        start_date = today - timedelta(days=days - 1)
+        end_date = today + timedelta(days=1)  # Exclusive upper bound
         
-        for i in range(days - 1, -1, -1):
-            date = today - timedelta(days=i)
-            dates.append(date.strftime('%Y-%m-%d'))
-            if period == 'weekly':
-                labels.append(date.strftime('%a'))
-            else:
-                labels.append(date.strftime('%b %d'))
+        conn = get_db_connection()
+        cursor = conn.cursor()
         
-        # Get listening activity (songs played per day)
-        listening_data = []
-        for date_str in dates:
-            cursor.execute('''
-                SELECT COUNT(*) as count
-                FROM recently_played
-                WHERE user_id = %s
-                AND DATE(played_at) = %s
-            ''', (user_id, date_str))
-            result = cursor.fetchone()
-            listening_data.append(result['count'] if result else 0)
+        # Get listening activity (songs played per day, zero-filled) in one
+        # pass over the (user_id, played_at) index, plus the daily rollups
+        # of partitions past the retention window
+        cursor.execute('''
+            WITH daily AS (
+                SELECT day, SUM(count) AS count FROM (
+                    SELECT date_trunc('day', played_at) AS day, COUNT(*) AS count
+                    FROM recently_played
+                    WHERE user_id = %(user_id)s
+                    AND played_at >= %(start)s AND played_at < %(end)s
+                    GROUP BY 1
+                    UNION ALL
+                    SELECT day::timestamp, SUM(plays)
+                    FROM recently_played_daily
+                    WHERE user_id = %(user_id)s
+                    AND day >= %(start)s AND day < %(end)s
+                    GROUP BY 1
+                ) AS counts
+                GROUP BY day
+            )
+            SELECT d.day::date AS day, COALESCE(daily.count, 0)::int AS count
+            FROM generate_series(%(start)s::timestamp, %(today)s::timestamp, interval '1 day') AS d(day)
+            LEFT JOIN daily ON daily.day = d.day
+            ORDER BY d.day
+        ''', {'user_id': user_id, 'start': start_date, 'end': end_date, 'today': today})
+        
+        listening_rows = cursor.fetchall()
+        labels = [row['day'].strftime(date_format) for row in listening_rows]
+        listening_data = [row['count'] for row in listening_rows]
         
         # Get emotion distribution
         cursor.execute('''
-            SELECT emotion, COUNT(*) as count
-            FROM emotion_history
-            WHERE user_id = %s
-            AND DATE(detected_at) >= DATE('now', '-' || %s || ' days')
+            SELECT emotion, SUM(count)::int AS count FROM (
+                SELECT emotion, COUNT(*) AS count
+                FROM emotion_history
+                WHERE user_id = %(user_id)s
+                AND detected_at >= %(start)s AND detected_at < %(end)s
+                GROUP BY emotion
+                UNION ALL
+                SELECT emotion, SUM(detections)
+                FROM emotion_history_daily
+                WHERE user_id = %(user_id)s
+                AND day >= %(start)s AND day < %(end)s
+                GROUP BY emotion
+            ) AS counts
             GROUP BY emotion
             ORDER BY count DESC
-        ''', (user_id, days))
+        ''', {'user_id': user_id, 'start': start_date, 'end': end_date})
         
         emotion_rows = cursor.fetchall()
         emotion_labels = []
@@ -1458,6 +2098,8 @@ def change_user_password(user_id):
 def delete_recently_played():
     """Delete a specific song from recently played history"""
     try:
+        history_writer.flush()  # Include rows still in the write-behind buffer
+        
         data = request.get_json()
         
         song_id = data.get('songId')
@@ -1474,6 +2116,17 @@ def delete_recently_played():
             WHERE user_id = %s AND song_id = %s AND played_at = %s
         ''', (session['user_id'], song_id, played_at))
         
+        if cursor.rowcount == 0:
+            # Already rolled up by the history maintenance: take the play off its day
+            cursor.execute('''
+                UPDATE recently_played_daily SET plays = plays - 1
+                WHERE user_id = %s AND song_id = %s AND day = %s::timestamp::date
+            ''', (session['user_id'], song_id, played_at))
+            cursor.execute('''
+                DELETE FROM recently_played_daily
+                WHERE user_id = %s AND song_id = %s AND day = %s::timestamp::date AND plays <= 0
+            ''', (session['user_id'], song_id, played_at))
+        
         conn.commit()
         cursor.close()
         conn.close()
@@ -1492,6 +2145,8 @@ def delete_recently_played():
 def clear_recently_played():
     """Clear all recently played history for current user"""
     try:
+        history_writer.flush()  # Include rows still in the write-behind buffer
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -1501,6 +2156,13 @@ def clear_recently_played():
         ''', (session['user_id'],))
         
         deleted_count = cursor.rowcount
+        
+        # Plays already rolled up by the history maintenance go too
+        cursor.execute('''
+            DELETE FROM recently_played_daily
+            WHERE user_id = %s
+        ''', (session['user_id'],))
+        
         conn.commit()
         cursor.close()
         conn.close()
@@ -1579,21 +2241,20 @@ def add_favorite():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check if already favorited
-        cursor.execute('SELECT id FROM favorites WHERE user_id = %s AND song_id = %s', 
-                      (session['user_id'], song_id))
-        if cursor.fetchone():
-            conn.close()
-            return jsonify({'success': True, 'message': 'Already in favorites'}), 200
-        
-        # Add to favorites
+        # Add to favorites; the UNIQUE (user_id, song_id) key catches repeats
         cursor.execute('''
             INSERT INTO favorites (user_id, song_id, song_title, artist, cover_url, audio_url, artist_photo_url)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, song_id) DO NOTHING
         ''', (session['user_id'], song_id, song_title, artist, cover_url, audio_url, artist_photo_url))
+        added = cursor.rowcount > 0
         
         conn.commit()
         conn.close()
+        favorites_cache.invalidate(session['user_id'])
+        
+        if not added:
+            return jsonify({'success': True, 'message': 'Already in favorites'}), 200
         
         print(f"✓ Favorite added by {session['email']}: {song_title}")
         return jsonify({'success': True, 'message': 'Added to favorites'}), 201
@@ -1615,12 +2276,13 @@ def remove_favorite(song_id):
             WHERE user_id = %s AND song_id = %s
         ''', (session['user_id'], song_id))
         
-        if cursor.rowcount == 0:
-            conn.close()
-            return jsonify({'error': 'Favorite not found'}), 404
-        
+        removed = cursor.rowcount > 0
         conn.commit()
         conn.close()
+        favorites_cache.invalidate(session['user_id'])
+        
+        if not removed:
+            return jsonify({'error': 'Favorite not found'}), 404
         
         print(f"✓ Favorite removed by {session['email']}: {song_id}")
         return jsonify({'success': True, 'message': 'Removed from favorites'}), 200
@@ -1634,17 +2296,48 @@ def remove_favorite(song_id):
 def check_favorite(song_id):
     """Check if song is favorited"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        is_favorited = favorite_status(session['user_id'], [song_id])[0]
+        return jsonify({'isFavorited': is_favorited}), 200
         
-        cursor.execute('SELECT id FROM favorites WHERE user_id = %s AND song_id = %s',
-                      (session['user_id'], song_id))
-        is_favorited = cursor.fetchone() is not None
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def favorite_status(user_id, song_ids):
+    """One bool per song ID; songs the cache does not know cost one = ANY(%s) query"""
+    def load(missing):
+        with db_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT song_id FROM favorites WHERE user_id = %s AND song_id = ANY(%s)',
+                               (user_id, missing))
+                return [row['song_id'] for row in cursor.fetchall()]
+    
+    favorited = favorites_cache.lookup(user_id, song_ids, load)
+    return [favorited[song_id] for song_id in song_ids]
+
+@app.route('/api/favorites/status', methods=['GET', 'POST'])
+@login_required
+def get_favorite_status():
+    """Favorite flags for many songs: POST {"songIds": [...]} or GET ?ids=a,b,c"""
+    try:
+        if request.method == 'POST':
+            song_ids = (request.get_json(silent=True) or {}).get('songIds')
+        else:
+            song_ids = [song_id for song_id in request.args.get('ids', '').split(',') if song_id]
         
-        conn.close()
-        return jsonify({'isFavorited': is_favorited}), 200
+        if not isinstance(song_ids, list) or not all(isinstance(song_id, str) for song_id in song_ids):
+            return jsonify({'error': 'songIds must be a list of song IDs'}), 400
+        if len(song_ids) > FAVORITES_STATUS_MAX_IDS:
+            return jsonify({'error': f'At most {FAVORITES_STATUS_MAX_IDS} song IDs per request'}), 400
+        
+        flags = favorite_status(session['user_id'], song_ids)
+        return jsonify({
+            'songIds': song_ids,
+            'favorited': flags,
+            'favoriteIds': [song_id for song_id, flag in zip(song_ids, flags) if flag]
+        }), 200
         
     except Exception as e:
+        print(f"Error checking favorite status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 # ============================================================
@@ -1754,34 +2447,47 @@ def change_password():
 @app.route('/api/playlists', methods=['GET'])
 @login_required
 def get_playlists():
-    """Get user's playlists with songs"""
+    """Get user's playlists with songs
+    
+    Optional ?limit=&offset= paginate the playlists; the total count is
+    returned in the X-Total-Count header.
+    """
     try:
+        limit = request.args.get('limit', type=int)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Get playlists
+        # Playlists and their songs in one query
         cursor.execute('''
-            SELECT id, name, description, created_at, updated_at
-            FROM playlists
-            WHERE user_id = %s
-            ORDER BY updated_at DESC
-        ''', (session['user_id'],))
+            SELECT p.id, p.name, p.description, p.created_at, p.updated_at,
+                   COUNT(*) OVER () AS total_count,
+                   COALESCE(
+                       json_agg(json_build_object(
+                           'song_id', ps.song_id,
+                           'song_title', ps.song_title,
+                           'artist', ps.artist,
+                           'cover_url', ps.cover_url,
+                           'audio_url', ps.audio_url,
+                           'artist_photo_url', ps.artist_photo_url
+                       ) ORDER BY ps.added_at ASC) FILTER (WHERE ps.id IS NOT NULL),
+                       '[]'::json
+                   ) AS songs
+            FROM playlists p
+            LEFT JOIN playlist_songs ps ON ps.playlist_id = p.id
+            WHERE p.user_id = %s
+            GROUP BY p.id
+            ORDER BY p.updated_at DESC, p.id DESC
+            LIMIT %s OFFSET %s
+        ''', (session['user_id'], limit if limit and limit > 0 else None, offset))
         
         playlists_rows = cursor.fetchall()
-        playlists = []
+        cursor.close()
+        conn.close()
         
+        playlists = []
         for playlist_row in playlists_rows:
-            playlist_id = playlist_row['id']
-            
-            # Get songs for this playlist
-            cursor.execute('''
-                SELECT song_id, song_title, artist, cover_url, audio_url, artist_photo_url
-                FROM playlist_songs
-                WHERE playlist_id = %s
-                ORDER BY added_at ASC
-            ''', (playlist_id,))
-            
-            songs_rows = cursor.fetchall()
             songs = [{
                 'id': row['song_id'],
                 'title': row['song_title'],
@@ -1790,10 +2496,10 @@ def get_playlists():
                 'coverUrl': row['cover_url'] or f'https://picsum.photos/400/400?random={row["song_id"]}',
                 'audioUrl': row['audio_url'] or 'https://www.soundhelix.com/examples/mp3/SoundHelix-Song-1.mp3',
                 'artistPhotoUrl': row['artist_photo_url'] or ''
-            } for row in songs_rows]
+            } for row in playlist_row['songs']]
             
             playlists.append({
-                'id': playlist_id,
+                'id': playlist_row['id'],
                 'name': playlist_row['name'],
                 'description': playlist_row['description'],
                 'songs': songs,
@@ -1801,9 +2507,8 @@ def get_playlists():
                 'updatedAt': playlist_row['updated_at'].isoformat() if playlist_row['updated_at'] else None
             })
         
-        cursor.close()
-        conn.close()
-        return jsonify(playlists), 200
+        total_count = playlists_rows[0]['total_count'] if playlists_rows else 0
+        return jsonify(playlists), 200, {'X-Total-Count': str(total_count)}
         
     except Exception as e:
         print(f"Error getting playlists: {str(e)}")
@@ -2067,17 +2772,39 @@ def remove_song_from_playlist(playlist_id, song_id):
 
 
 
+# 'startup' warms models in each process on import, 'post_fork' leaves it to
+# the gunicorn hook in gunicorn.conf.py (for preload_app), 'off' loads lazily
+MODEL_WARMUP = os.getenv('VIBESYNC_MODEL_WARMUP', 'startup').lower()
+
 def initialize_app():
     """Initialize database on app startup"""
+    if ENABLE_EMOTION_DETECTION and MODEL_WARMUP == 'startup':
+        inference_backend.warm_up_in_background()
+
     try:
         init_postgres()  # Changed from init_sqlite()
+    except Exception as e:
+        print(f"Error initializing database: {e}")
+
+    # MongoDB setup does not depend on PostgreSQL
+    try:
+        media_jobs.start()  # Resumes uploads left unfinished by earlier processes
         songs_collection.create_index('emotions')
+        songs_collection.create_index(SONG_CATALOG_SORT)  # Catalog keyset paging
+        songs_collection.create_index([('language', 1)] + SONG_CATALOG_SORT)  # ...within a language
+        songs_collection.create_index('contentHash', unique=True, sparse=True)  # Bulk import dedup
         print("\n" + "="*60)
         print("🎵 VIBESYNC - DATABASE INITIALIZED")
         print("="*60)
         print(f"\n🐘 PostgreSQL: Connected to Neon")
         print(f"📦 MongoDB: {MONGO_URI[:50]}...")
         print(f"📊 Songs in DB: {songs_collection.count_documents({})}")
+        if ENABLE_EMOTION_DETECTION:
+            print(f"🧠 Inference: {inference_backend.mode} (warm-up: {MODEL_WARMUP})")
+        else:
+            print("🧠 Inference: disabled (API-only mode)")
+        print(f"⏱️  Startup: {time.perf_counter() - _import_started:.2f}s, "
+              f"RSS {current_rss_bytes() / (1024 * 1024):.0f} MB")
         print("\n👤 Admin Credentials:")
         print("   Email: admin@music.com")
         print("   Pass:  admin123")
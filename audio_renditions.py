@@ -0,0 +1,152 @@
+"""
+VibeSync audio renditions - smaller encodings of every uploaded track.
+
+Uploads are stored as sent, FLAC and WAV included. The media jobs behind
+/api/songs/upload and the bulk import also run each track through ffmpeg
+into AAC renditions at AUDIO_RENDITIONS kbps (default 64,128,256). The
+renditions are stored next to the original by the media storage backend
+and listed on the song:
+
+    "audioBitrate": 921,
+    "renditions": [{"bitrate": 64, "codec": "aac", "url": "...", "bytes": 1913650}, ...]
+
+Bitrates that are not clearly below the source's own are skipped, so a
+128 kbps MP3 is not re-encoded at 128 or 256. GET /api/songs/<id>/stream
+picks a rendition from a network hint (pick_rendition). Without ffmpeg and
+ffprobe on PATH (or FFMPEG_PATH / FFPROBE_PATH), songs keep only their
+original. Transcoding is best-effort: a track ffmpeg cannot encode (or
+whose renditions cannot be stored) keeps its original with renditions [].
+"""
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from media_storage import file_sha256
+
+AUDIO_RENDITIONS = tuple(sorted({int(b) for b in os.getenv('AUDIO_RENDITIONS', '64,128,256').split(',') if b.strip()}))
+AUDIO_DEFAULT_KBPS = int(os.getenv('AUDIO_DEFAULT_KBPS', '128'))  # When the client gives no hint
+AUDIO_TRANSCODE_TIMEOUT = float(os.getenv('AUDIO_TRANSCODE_TIMEOUT', '300'))
+FFMPEG = os.getenv('FFMPEG_PATH') or shutil.which('ffmpeg')
+FFPROBE = os.getenv('FFPROBE_PATH') or shutil.which('ffprobe')
+
+# Highest bitrate (kbps) per effective connection type (Network Information
+# API effectiveType / ECT client hint) or connection type
+NETWORK_BUDGETS = {
+    'slow-2g': 64,
+    '2g': 64,
+    '3g': 128,
+    '4g': 256,
+    'wifi': 256,
+    'ethernet': 256
+}
+DOWNLINK_SHARE = 0.5  # Leave half of the measured downlink for everything else
+_SKIP_RATIO = 0.9  # Skip renditions above 90% of the source bitrate
+
+
+class TranscodeError(RuntimeError):
+    """Renditions could not be made; source_kbps is the probed source bitrate, if known"""
+
+    def __init__(self, message, source_kbps=None):
+        super().__init__(message)
+        self.source_kbps = source_kbps
+
+
+def transcoding_enabled():
+    return bool(AUDIO_RENDITIONS and FFMPEG and FFPROBE)
+
+
+def source_bitrate(path):
+    """The audio bitrate of a file in kbps, or None if ffprobe cannot tell"""
+    result = subprocess.run(
+        [FFPROBE, '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'stream=bit_rate:format=bit_rate', '-of', 'json', path],
+        capture_output=True, check=True, timeout=60
+    )
+    info = json.loads(result.stdout or b'{}')
+    for value in [stream.get('bit_rate') for stream in info.get('streams', [])] + [info.get('format', {}).get('bit_rate')]:
+        if value and str(value).isdigit():
+            return int(value) // 1000
+    return None
+
+
+def transcode(path, bitrate, out_path):
+    """Encode the first audio stream of path as AAC at bitrate kbps into an .m4a"""
+    try:
+        subprocess.run(
+            [FFMPEG, '-nostdin', '-v', 'error', '-y', '-i', path, '-map', '0:a:0', '-vn', '-map_metadata', '-1',
+             '-c:a', 'aac', '-b:a', f'{bitrate}k', '-movflags', '+faststart', out_path],
+            capture_output=True, check=True, timeout=AUDIO_TRANSCODE_TIMEOUT
+        )
+    except subprocess.CalledProcessError as e:
+        message = e.stderr.decode(errors='replace').strip().splitlines()
+        raise RuntimeError(f"ffmpeg failed at {bitrate} kbps: {message[-1] if message else e}") from None
+
+
+def create_renditions(path, storage, bitrates=AUDIO_RENDITIONS):
+    """Transcode and store the renditions of one track
+
+    Returns (renditions sorted by bitrate, source bitrate in kbps or None).
+    Raises TranscodeError; callers fall back to the original audio.
+    """
+    if not transcoding_enabled():
+        return [], None
+
+    try:
+        source_kbps = source_bitrate(path)
+    except (subprocess.SubprocessError, OSError, ValueError) as e:
+        raise TranscodeError(f'ffprobe failed: {e}') from None
+
+    renditions = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='vibesync-renditions-') as tmp_dir:
+            for bitrate in bitrates:
+                if source_kbps is not None and bitrate > source_kbps * _SKIP_RATIO:
+                    continue
+                out_path = os.path.join(tmp_dir, f'{bitrate}k.m4a')
+                transcode(path, bitrate, out_path)
+                renditions.append({
+                    'bitrate': bitrate,
+                    'codec': 'aac',
+                    'url': storage.save(out_path, 'audio', file_sha256(out_path)),
+                    'bytes': os.path.getsize(out_path)
+                })
+    except Exception as e:
+        raise TranscodeError(str(e), source_kbps) from None
+    return renditions, source_kbps
+
+
+# ============================================================
+# PICKING A RENDITION
+# ============================================================
+
+def bitrate_budget(network=None, downlink=None, save_data=False):
+    """Highest bitrate (kbps) worth sending for a network hint"""
+    if save_data:
+        return 0  # The lowest rendition
+    budgets = []
+    if network in NETWORK_BUDGETS:
+        budgets.append(NETWORK_BUDGETS[network])
+    if downlink:
+        budgets.append(int(downlink * 1000 * DOWNLINK_SHARE))
+    return min(budgets) if budgets else AUDIO_DEFAULT_KBPS
+
+
+def pick_rendition(song, budget):
+    """The best source of a song within budget kbps, or its lowest if none fits
+
+    Candidates are the renditions plus the original (its bitrate unknown
+    counts as highest). Returns {'url', 'bitrate', 'codec', 'original'}.
+    """
+    candidates = [dict(rendition, original=False) for rendition in song.get('renditions') or []]
+    if song.get('audioUrl'):
+        candidates.append({'url': song['audioUrl'], 'bitrate': song.get('audioBitrate'), 'codec': None, 'original': True})
+    if not candidates:
+        return None
+
+    def rate(candidate):
+        return candidate['bitrate'] if candidate['bitrate'] is not None else float('inf')
+
+    fitting = [candidate for candidate in candidates if rate(candidate) <= budget]
+    return max(fitting, key=rate) if fitting else min(candidates, key=rate)
@@ -0,0 +1,63 @@
+"""
+Benchmark: per-request vs micro-batched emotion classification.
+
+Simulates N concurrent webcam users, each classifying face crops as fast as
+possible, and reports faces/second for both paths. Needs TensorFlow and
+DeepFace (the real emotion model is used).
+
+Usage:
+    python benchmarks/bench_emotion_batching.py [users] [seconds] [max_batch] [max_wait_ms]
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emotion_pipeline import EmotionBatcher, classify_faces
+from model_registry import registry
+
+
+def run(classify, users, seconds):
+    """Hammer classify() from `users` threads and return faces/second"""
+    rng = np.random.default_rng(0)
+    faces = rng.random((users, 48, 48), dtype=np.float32)
+    counts = [0] * users
+    stop = time.monotonic() + seconds
+
+    def user(i):
+        while time.monotonic() < stop:
+            classify(faces[i])
+            counts[i] += 1
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts) / seconds
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    max_batch = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    max_wait_ms = float(sys.argv[4]) if len(sys.argv) > 4 else 5
+
+    registry.warm_up()
+
+    per_request = run(lambda face: classify_faces(face[np.newaxis])[0], users, seconds)
+
+    batcher = EmotionBatcher(max_batch_size=max_batch, max_wait_ms=max_wait_ms)
+    batched = run(batcher.classify, users, seconds)
+
+    print(f"{users} concurrent users, {seconds:.0f}s per run")
+    print(f"  per-request (batch of 1): {per_request:8.1f} faces/s")
+    print(f"  micro-batched:            {batched:8.1f} faces/s ({batched / per_request:.1f}x)")
+    print(f"  batcher stats: {batcher.stats()}")
+
+
+if __name__ == '__main__':
+    main()
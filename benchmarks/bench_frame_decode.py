@@ -0,0 +1,71 @@
+"""
+Benchmark: webcam frame decoding for /detect_emotion.
+
+Compares the old path (base64 -> PIL -> RGB2BGR -> temp_frame.jpg -> read
+back from disk) with the in-memory path (base64 -> cv2.imdecode).
+
+Usage:
+    python benchmarks/bench_frame_decode.py [iterations]
+"""
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emotion_pipeline import decode_image_bytes
+
+
+def make_data_url(width=640, height=480):
+    """Build a JPEG data URL like canvas.toDataURL('image/jpeg', 0.8)"""
+    rng = np.random.default_rng(42)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+    ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return 'data:image/jpeg;base64,' + base64.b64encode(encoded.tobytes()).decode()
+
+
+def legacy_decode(data_url, temp_path):
+    """The old detect_emotion path, including the disk round-trip"""
+    image_bytes = base64.b64decode(data_url.split(',')[1])
+    image_np = np.array(Image.open(io.BytesIO(image_bytes)))
+    image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+    cv2.imwrite(temp_path, image_np)
+    return cv2.imread(temp_path)  # what DeepFace does with img_path
+
+
+def in_memory_decode(data_url):
+    """The current path: base64 -> cv2.imdecode, no disk"""
+    return decode_image_bytes(base64.b64decode(data_url.split(',', 1)[1]))
+
+
+def time_per_call(fn, iterations):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    data_url = make_data_url()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        temp_path = os.path.join(tmp, 'temp_frame.jpg')
+        legacy_ms = time_per_call(lambda: legacy_decode(data_url, temp_path), iterations)
+    memory_ms = time_per_call(lambda: in_memory_decode(data_url), iterations)
+
+    print(f"Frame: 640x480 JPEG, {len(data_url) / 1024:.1f} KB data URL, {iterations} iterations")
+    print(f"  legacy (PIL + temp file): {legacy_ms:7.3f} ms/frame")
+    print(f"  in-memory (cv2.imdecode): {memory_ms:7.3f} ms/frame")
+    print(f"  saved per frame:          {legacy_ms - memory_ms:7.3f} ms ({legacy_ms / memory_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: upload size and server-side decode cost of a webcam frame.
+
+Compares the JSON path of /detect_emotion (canvas.toDataURL -> JSON ->
+json.loads -> split -> b64decode -> cv2.imdecode) with the binary path of
+/detect_emotion/frame (raw JPEG body -> memoryview -> cv2.imdecode), for a
+full 640x480 frame and the 320x240 frame the client now sends.
+
+Usage:
+    python benchmarks/bench_frame_upload.py [iterations]
+"""
+import base64
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emotion_pipeline import decode_image_bytes
+
+
+def make_jpeg(width, height):
+    """Encode a frame like canvas.toBlob('image/jpeg', 0.8)"""
+    rng = np.random.default_rng(42)
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+    ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes()
+
+
+def json_path(body):
+    """What /detect_emotion does with the request body"""
+    data_url = json.loads(body)['image']
+    return decode_image_bytes(base64.b64decode(data_url.split(',', 1)[1]))
+
+
+def binary_path(body):
+    """What /detect_emotion/frame does with the request body"""
+    return decode_image_bytes(memoryview(body))
+
+
+def time_per_call(fn, iterations):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print(f"{iterations} iterations per case")
+    for width, height in ((640, 480), (320, 240)):
+        jpeg = make_jpeg(width, height)
+        json_body = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()}).encode()
+
+        json_ms = time_per_call(lambda: json_path(json_body), iterations)
+        binary_ms = time_per_call(lambda: binary_path(jpeg), iterations)
+
+        print(f"Frame {width}x{height}:")
+        print(f"  JSON data URL:  {len(json_body) / 1024:7.1f} KB upload  {json_ms:7.3f} ms decode")
+        print(f"  binary body:    {len(jpeg) / 1024:7.1f} KB upload  {binary_ms:7.3f} ms decode")
+
+
+if __name__ == '__main__':
+    main()
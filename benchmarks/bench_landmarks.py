@@ -0,0 +1,80 @@
+"""
+Benchmark: the 68-point landmark overlay built for every /detect_emotion hit.
+
+Compares the old eight Python loops (scalar np.cos/np.sin, one dict per
+point) with face_landmarks: a precomputed template and one vectorized
+affine transform, returned both flat and as the dict list.
+
+Usage:
+    python benchmarks/bench_landmarks.py [iterations]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_landmarks import landmarks_as_dicts, landmarks_for_faces
+
+BOX = (212, 118, 190, 190)
+
+
+def legacy_landmarks(x, y, w, h):
+    """The loops detect_emotion used to run"""
+    landmarks = []
+    for i in range(17):
+        angle = (i / 16.0) * np.pi
+        landmarks.append({'x': int(x + w/2 + (w/2.2) * np.cos(angle + np.pi)),
+                          'y': int(y + h/2 + (h/1.5) * np.sin(angle + np.pi/6))})
+    for start in (0.25, 0.55):
+        for i in range(5):
+            landmarks.append({'x': int(x + w * (start + i * 0.05)), 'y': int(y + h * 0.3)})
+    for i in range(4):
+        landmarks.append({'x': int(x + w/2), 'y': int(y + h * (0.35 + i * 0.08))})
+    for i in range(5):
+        landmarks.append({'x': int(x + w * (0.35 + i * 0.075)), 'y': int(y + h * 0.6)})
+    eye_center_y = y + int(h * 0.4)
+    for eye_center_x in (x + int(w * 0.3), x + int(w * 0.7)):
+        for i in range(6):
+            angle = (i / 6.0) * 2 * np.pi
+            landmarks.append({'x': int(eye_center_x + (w * 0.05) * np.cos(angle)),
+                              'y': int(eye_center_y + (h * 0.03) * np.sin(angle))})
+    mouth_center_x, mouth_center_y = x + int(w/2), y + int(h * 0.75)
+    for count, rx, ry in ((12, 0.15, 0.06), (8, 0.1, 0.04)):
+        for i in range(count):
+            angle = (i / count) * 2 * np.pi
+            landmarks.append({'x': int(mouth_center_x + (w * rx) * np.cos(angle)),
+                              'y': int(mouth_center_y + (h * ry) * np.sin(angle))})
+    return landmarks
+
+
+def vectorized_landmarks(boxes):
+    points = landmarks_for_faces(boxes)
+    return landmarks_as_dicts(points[0]), [face.ravel().tolist() for face in points]
+
+
+def time_per_call(fn, iterations):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    boxes4 = [BOX, (20, 30, 90, 90), (420, 60, 120, 120), (300, 300, 80, 80)]
+
+    legacy = np.array([[p['x'], p['y']] for p in legacy_landmarks(*BOX)])
+    drift = np.abs(legacy - landmarks_for_faces([BOX])[0]).max()
+
+    print(f"{iterations} iterations, max difference from the loops: {drift} px")
+    print(f"  loops, 1 face:       {time_per_call(lambda: legacy_landmarks(*BOX), iterations):7.4f} ms")
+    print(f"  loops, 4 faces:      {time_per_call(lambda: [legacy_landmarks(*b) for b in boxes4], iterations):7.4f} ms")
+    print(f"  vectorized, 1 face:  {time_per_call(lambda: vectorized_landmarks([BOX]), iterations):7.4f} ms")
+    print(f"  vectorized, 4 faces: {time_per_call(lambda: vectorized_landmarks(boxes4), iterations):7.4f} ms")
+
+
+if __name__ == '__main__':
+    main()
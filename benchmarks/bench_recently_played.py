@@ -0,0 +1,66 @@
+"""
+Benchmark: song enrichment for GET /api/recently-played.
+
+Compares one find_one() per history row (the old N+1 pattern) with the
+single $in query used by fetch_songs_by_ids(), for a 50-item history.
+Runs against MONGO_URI (falls back to localhost like app.py).
+
+Usage:
+    python benchmarks/bench_recently_played.py [iterations]
+"""
+import os
+import statistics
+import sys
+import time
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+HISTORY_SIZE = 50
+PROJECTION = {'coverUrl': 1, 'audioUrl': 1, 'artistPhotoUrl': 1}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def time_ms(fn, iterations):
+    fn()  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    load_dotenv()
+    client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'), serverSelectionTimeoutMS=5000)
+    songs = client['vibesync_db']['songs']
+
+    ids = [str(doc['_id']) for doc in songs.find({}, {'_id': 1}).limit(HISTORY_SIZE)]
+    if not ids:
+        print("No songs in vibesync_db.songs - nothing to benchmark")
+        return
+    # A history repeats songs; pad to 50 rows like a real page
+    history = (ids * (HISTORY_SIZE // len(ids) + 1))[:HISTORY_SIZE]
+
+    def per_row():
+        return [songs.find_one({'_id': ObjectId(song_id)}, PROJECTION) for song_id in history]
+
+    def single_in():
+        object_ids = [ObjectId(song_id) for song_id in set(history)]
+        return {str(doc['_id']): doc for doc in songs.find({'_id': {'$in': object_ids}}, PROJECTION)}
+
+    print(f"{HISTORY_SIZE}-item history ({len(ids)} distinct songs), {iterations} iterations")
+    for name, fn in (('find_one per row', per_row), ('single $in query', single_in)):
+        samples = time_ms(fn, iterations)
+        print(f"  {name:<17} p50 {statistics.median(samples):8.2f} ms   p99 {percentile(samples, 99):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: bulk song import throughput.
+
+Imports a generated catalog (a manifest plus a directory of small fake
+audio files) through song_import.SongImport with a simulated upload
+latency and an in-memory collection, comparing the old shape - one upload
+at a time, one insert per song - with the pooled, batched import.
+
+Usage:
+    python benchmarks/bench_song_import.py [songs] [upload_ms]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from song_import import SongImport, prepare_import
+
+EXTENSIONS = {'audio': {'mp3'}, 'covers': {'jpg'}, 'artists': {'jpg'}}
+
+
+class MemoryCollection:
+    """Just enough of a pymongo collection for the importer"""
+
+    def __init__(self):
+        self.documents = []
+        self.insert_calls = 0
+
+    def find(self, query, projection=None):
+        wanted = set(query['contentHash']['$in'])
+        return [doc for doc in self.documents if doc['contentHash'] in wanted]
+
+    def insert_many(self, documents, ordered=True):
+        self.insert_calls += 1
+        for doc in documents:
+            doc['_id'] = ObjectId()
+        self.documents.extend(documents)
+
+
+class Upload:
+    """A werkzeug FileStorage stand-in"""
+
+    def __init__(self, filename, stream):
+        self.filename = filename
+        self.stream = stream
+
+
+def make_catalog(root, songs):
+    os.makedirs(os.path.join(root, 'audio'))
+    manifest = os.path.join(root, 'manifest.csv')
+    with open(manifest, 'w') as f:
+        f.write('title,artist,emotions,audio\n')
+        for i in range(songs):
+            with open(os.path.join(root, 'audio', f'{i}.mp3'), 'wb') as audio:
+                audio.write(os.urandom(64 * 1024))
+            f.write(f'Song {i},Artist {i % 50},happy;calm,{i}.mp3\n')
+    return manifest
+
+
+def run_import(root, manifest, upload_ms, workers, batch_size):
+    def upload(path, folder, sha256):
+        time.sleep(upload_ms / 1000.0)  # Network round trip to the media host
+        return f'https://media.example/{folder}/{sha256[:32]}'
+
+    base_dir = tempfile.mkdtemp(dir=root)
+    collection = MemoryCollection()
+    with open(manifest, 'rb') as stream:
+        import_id = prepare_import(Upload(manifest, stream), media_root=root, media_dir='audio', base_dir=base_dir)
+    job = SongImport(import_id, collection, upload, EXTENSIONS, workers=workers,
+                     batch_size=batch_size, base_dir=base_dir)
+    started = time.perf_counter()
+    progress = job.run()
+    return time.perf_counter() - started, progress, collection.insert_calls
+
+
+def main():
+    songs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    upload_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    root = tempfile.mkdtemp()
+    try:
+        manifest = make_catalog(root, songs)
+        print(f"{songs} songs, {upload_ms:.0f} ms per upload")
+        for label, workers, batch_size in (('sequential, 1 insert/song', 1, 1),
+                                           ('8 workers, batches of 100', 8, 100),
+                                           ('16 workers, batches of 100', 16, 100)):
+            elapsed, progress, inserts = run_import(root, manifest, upload_ms, workers, batch_size)
+            print(f"  {label:28s} {elapsed:7.2f} s  {songs / elapsed:8.1f} songs/s  "
+                  f"{inserts:4d} insert calls  ({progress['inserted']} added)")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
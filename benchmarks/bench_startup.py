@@ -0,0 +1,61 @@
+"""
+Benchmark: worker startup time and RSS, API-only vs full ML mode.
+
+Imports app.py in a fresh interpreter for each mode and reports the import
+time and resident memory. In full mode it also waits for the model warm-up,
+so the RSS figure is what an inference-capable worker settles at.
+Needs the usual .env (DATABASE_URL, MONGO_URI).
+
+Usage:
+    python benchmarks/bench_startup.py [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+warm = None
+if app.ENABLE_EMOTION_DETECTION:
+    from model_registry import registry
+    registry.warm_up()
+    warm = time.perf_counter() - start
+from model_registry import current_rss_bytes
+print('BENCH ' + json.dumps({'import': imported, 'warm': warm, 'rss': current_rss_bytes()}))
+'''
+
+MODES = {
+    'api-only': {'ENABLE_EMOTION_DETECTION': 'false'},
+    'full (inline ML)': {'ENABLE_EMOTION_DETECTION': 'true', 'INFERENCE_MODE': 'inline',
+                         'VIBESYNC_MODEL_WARMUP': 'off'},
+}
+
+
+def measure(extra_env):
+    env = dict(os.environ, **extra_env)
+    out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    line = next(l for l in out.splitlines() if l.startswith('BENCH '))
+    return json.loads(line[len('BENCH '):])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print(f"{'mode':<18} {'import (s)':>10} {'ready (s)':>10} {'RSS (MB)':>9}")
+    for name, extra_env in MODES.items():
+        results = [measure(extra_env) for _ in range(runs)]
+        imported = min(r['import'] for r in results)
+        ready = min(r['warm'] or r['import'] for r in results)
+        rss = min(r['rss'] for r in results) / (1024 * 1024)
+        print(f"{name:<18} {imported:>10.2f} {ready:>10.2f} {rss:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+VibeSync PostgreSQL connection pool.
+
+Wraps psycopg2's ThreadedConnectionPool with what the app needs on top of it:
+bounded waiting when the pool is exhausted, health checks for idle
+connections, a context manager, and checkout/wait metrics. The pool is
+created lazily per process so it is never shared across a gunicorn fork.
+
+Set DB_POOL_MODE=direct when running behind pgbouncer: every checkout then
+opens a fresh connection and pgbouncer does the pooling.
+"""
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+
+class PoolTimeout(PoolError):
+    """No connection became available within the checkout timeout"""
+
+
+class PooledConnection:
+    """A checked-out connection; close() hands it back to the pool
+
+    Behaves like the underlying psycopg2 connection. Used as a context
+    manager it commits on success, rolls back on error and is returned.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError('connection already returned to the pool')
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None and not self._conn.closed:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+
+
+class PostgresPool:
+    """Thread-safe, fork-aware PostgreSQL pool with metrics"""
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=10, timeout=10.0,
+                 health_check_seconds=30.0, mode='pool'):
+        self.connect_kwargs = connect_kwargs
+        self.minconn = max(0, int(minconn))
+        self.maxconn = max(1, int(maxconn))
+        self.timeout = float(timeout)
+        self.health_check_seconds = float(health_check_seconds)
+        self.mode = mode
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._last_used = {}
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._checkouts = 0
+        self._in_use = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _ensure_pool(self):
+        # (Re)create the pool in each process; sockets must not cross a fork
+        if self._pool is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                return
+            self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.connect_kwargs)
+            self._slots = threading.BoundedSemaphore(self.maxconn)
+            self._pid = os.getpid()
+            # Connections opened up front (minconn) start their idle clock now
+            now = time.monotonic()
+            self._last_used = {id(conn): now for conn in getattr(self._pool, '_pool', [])}
+            self._reset_metrics()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.health_check_seconds:
+            return True  # Freshly opened, or used recently enough
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds"""
+        if self.mode == 'direct':
+            with self._lock:
+                self._checkouts += 1
+                self._in_use += 1
+            return PooledConnection(self, psycopg2.connect(**self.connect_kwargs))
+
+        self._ensure_pool()
+
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f'No PostgreSQL connection available after {self.timeout:.1f}s')
+        waited = time.monotonic() - start
+
+        try:
+            conn = self._pool.getconn()
+            while not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                with self._lock:
+                    self._discarded += 1
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return PooledConnection(self, conn)
+
+    def putconn(self, conn):
+        """Return a raw connection, rolling back anything left open"""
+        with self._lock:
+            self._in_use -= 1
+
+        if self.mode == 'direct':
+            conn.close()
+            return
+
+        broken = bool(conn.closed)
+        if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        try:
+            if broken:
+                self._last_used.pop(id(conn), None)
+                with self._lock:
+                    self._discarded += 1
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    def connection(self):
+        """Context manager: `with pool.connection() as conn: ...`"""
+        return self.getconn()
+
+    def metrics(self):
+        """Checkout counts and wait times for monitoring"""
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                'mode': self.mode,
+                'minSize': self.minconn,
+                'maxSize': self.maxconn,
+                'inUse': self._in_use,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'waitMsAvg': round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'waitMsMax': round(self._wait_max * 1000, 3)
+            }
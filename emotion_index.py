@@ -0,0 +1,175 @@
+"""
+VibeSync emotion index - in-memory emotion -> songs inverted index.
+
+Recommendations are drawn from the index instead of a Mongo query per
+request: songs are sampled by the classifier's emotion probabilities,
+de-duplicated, ranked by how well they match the whole mood vector, and
+recently played tracks are skipped while there are enough alternatives.
+
+The index is updated incrementally by the admin song routes in this worker
+and rebuilt when the shared song cache version changes (another worker
+wrote) or when it is older than max_age_seconds. refresh() lets one thread
+rebuild while the others keep serving the index they have.
+"""
+import random
+import threading
+import time
+from itertools import accumulate
+
+
+class EmotionIndex:
+    """Emotion -> song id lists with O(1) insert/remove and O(k) sampling"""
+
+    def __init__(self, max_age_seconds=300.0):
+        self.max_age = float(max_age_seconds)
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._songs = {}           # song id -> song document
+        self._by_emotion = {}      # emotion -> [song id, ...]
+        self._positions = {}       # (emotion, song id) -> index in _by_emotion[emotion]
+        self._version = None
+        self._built_at = None
+
+    # --------------------------------------------------------
+    # Building and incremental updates
+    # --------------------------------------------------------
+
+    def is_stale(self, version):
+        """True if the index must be rebuilt for this cache version"""
+        if self._built_at is None or version != self._version:
+            return True
+        return self.max_age > 0 and time.monotonic() - self._built_at > self.max_age
+
+    def refresh(self, version, load_songs):
+        """Rebuild from load_songs() if stale, in one thread at a time
+
+        While a rebuild runs, other callers use the current index; only a
+        never-built index makes them wait for it.
+        """
+        if not self.is_stale(version):
+            return
+        if not self._rebuild_lock.acquire(blocking=self._built_at is None):
+            return
+        try:
+            if self.is_stale(version):  # Another thread may have just rebuilt
+                self.rebuild(load_songs(), version)
+        finally:
+            self._rebuild_lock.release()
+
+    def rebuild(self, songs, version=None):
+        """Replace the whole index with these (serialized) song documents"""
+        index = EmotionIndex(self.max_age)
+        for song in songs:
+            index._add(song)
+
+        with self._lock:
+            self._songs = index._songs
+            self._by_emotion = index._by_emotion
+            self._positions = index._positions
+            self._version = version
+            self._built_at = time.monotonic()
+
+    def upsert(self, song, version=None):
+        """Add or replace one song"""
+        with self._lock:
+            self._remove(str(song['_id']))
+            self._add(song)
+            if version is not None:
+                self._version = version
+
+    def remove(self, song_id, version=None):
+        """Drop one song"""
+        with self._lock:
+            self._remove(str(song_id))
+            if version is not None:
+                self._version = version
+
+    def _add(self, song):
+        song_id = str(song['_id'])
+        self._songs[song_id] = song
+        for emotion in set(song.get('emotions') or []):
+            ids = self._by_emotion.setdefault(emotion, [])
+            self._positions[(emotion, song_id)] = len(ids)
+            ids.append(song_id)
+
+    def _remove(self, song_id):
+        song = self._songs.pop(song_id, None)
+        if song is None:
+            return
+        for emotion in set(song.get('emotions') or []):
+            ids = self._by_emotion[emotion]
+            position = self._positions.pop((emotion, song_id))
+            # Swap with the last id so removal stays O(1)
+            last_id = ids.pop()
+            if last_id != song_id:
+                ids[position] = last_id
+                self._positions[(emotion, last_id)] = position
+            if not ids:
+                del self._by_emotion[emotion]
+
+    # --------------------------------------------------------
+    # Recommendations
+    # --------------------------------------------------------
+
+    def recommend(self, weights, k=10, exclude=(), rng=None):
+        """Up to k songs for a mood vector such as {'happy': 70.0, 'neutral': 20.0}
+
+        Songs in `exclude` (e.g. recently played ids) are only used when
+        there are not enough other matches. Results are ranked by the summed
+        weight of the emotions each song is tagged with; ties stay shuffled.
+        """
+        rng = rng or random
+        with self._lock:
+            weights = {
+                emotion: float(weight) for emotion, weight in weights.items()
+                if weight and weight > 0 and self._by_emotion.get(emotion)
+            }
+            if not weights or k <= 0:
+                return []
+
+            exclude = set(exclude)
+            picked = self._sample(weights, k, exclude, rng)
+            if len(picked) < k and exclude:
+                # Not enough fresh songs - fall back to recently played ones
+                picked.extend(self._sample(weights, k - len(picked), set(picked), rng))
+
+            scores = {song_id: self._score(song_id, weights) for song_id in picked}
+            picked.sort(key=scores.get, reverse=True)  # Stable: ties keep random order
+            return [self._songs[song_id] for song_id in picked]
+
+    def _score(self, song_id, weights):
+        return sum(weights.get(emotion, 0.0) for emotion in set(self._songs[song_id].get('emotions') or []))
+
+    def _sample(self, weights, k, skip, rng):
+        candidates = sum(len(self._by_emotion[emotion]) for emotion in weights)
+
+        if candidates <= k * 4:
+            # Small pool: take the best matches outright, shuffled within ties
+            ids = list({song_id for emotion in weights for song_id in self._by_emotion[emotion]} - skip)
+            rng.shuffle(ids)
+            ids.sort(key=lambda song_id: self._score(song_id, weights), reverse=True)
+            return ids[:k]
+
+        # Large pool: weighted random draws, O(k) expected
+        emotions = list(weights)
+        cum_weights = list(accumulate(weights[emotion] for emotion in emotions))
+        picked = []
+        seen = set(skip)
+        for _ in range(k * 8):
+            if len(picked) == k:
+                break
+            ids = self._by_emotion[rng.choices(emotions, cum_weights=cum_weights)[0]]
+            song_id = ids[rng.randrange(len(ids))]
+            if song_id not in seen:
+                seen.add(song_id)
+                picked.append(song_id)
+        return picked
+
+    def stats(self):
+        """Index size for monitoring"""
+        with self._lock:
+            return {
+                'songs': len(self._songs),
+                'emotions': {emotion: len(ids) for emotion, ids in self._by_emotion.items()},
+                'ageSeconds': round(time.monotonic() - self._built_at, 1) if self._built_at else None
+            }
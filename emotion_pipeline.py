@@ -0,0 +1,265 @@
+"""
+VibeSync emotion pipeline - in-memory frame decoding and emotion analysis.
+
+Frames never touch the disk: the request bytes are decoded straight into a
+grayscale NumPy array that the face detector and the emotion classifier consume.
+Every call works on its own array, so concurrent requests cannot see each
+other's frames. Face crops from concurrent requests can be classified together
+through EmotionBatcher.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from model_registry import get_emotion_model, get_face_cascade
+
+
+# ============================================================
+# FRAME DECODING
+# ============================================================
+
+def decode_image_bytes(image_bytes, grayscale=False):
+    """Decode JPEG/PNG/WebP bytes into a BGR (or grayscale) NumPy frame"""
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    if buffer.size == 0:
+        raise ValueError('Empty image data')
+
+    # IMREAD_COLOR always yields 3-channel BGR (alpha is dropped);
+    # IMREAD_GRAYSCALE lets the JPEG decoder skip the chroma planes
+    frame = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError('Could not decode image data')
+    return frame
+
+
+# ============================================================
+# CHANGE DETECTION
+# ============================================================
+
+# Frames are compared as 16x16 grayscale thumbnails; a mean absolute
+# difference below FRAME_CHANGE_THRESHOLD (fraction of full scale) counts
+# as "same scene"
+FRAME_SIGNATURE_SIZE = 16
+FRAME_CHANGE_THRESHOLD = float(os.getenv('FRAME_CHANGE_THRESHOLD', '0.03'))
+
+
+def frame_signature(frame):
+    """Tiny grayscale thumbnail of a BGR or grayscale frame, as bytes"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    thumbnail = cv2.resize(gray, (FRAME_SIGNATURE_SIZE, FRAME_SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    return thumbnail.tobytes()
+
+
+def frame_changed(previous_signature, signature, threshold=FRAME_CHANGE_THRESHOLD):
+    """True if two frame signatures differ by more than the threshold"""
+    if not previous_signature or len(previous_signature) != len(signature):
+        return True
+    previous = np.frombuffer(previous_signature, dtype=np.uint8).astype(np.int16)
+    current = np.frombuffer(signature, dtype=np.uint8).astype(np.int16)
+    return np.abs(current - previous).mean() / 255.0 > threshold
+
+
+# ============================================================
+# DETECTION AND CLASSIFICATION
+# ============================================================
+
+# Output order of the DeepFace emotion model
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+FACE_INPUT_SIZE = 48
+
+# A client ROI (the previous faceRegion) is grown by this fraction of its
+# size on every side before searching; smaller windows fall back to the
+# full frame
+FACE_ROI_MARGIN = float(os.getenv('FACE_ROI_MARGIN', '0.5'))
+FACE_ROI_MIN_SIZE = 24  # Haar cascade window
+
+
+def roi_window(roi, shape, margin=FACE_ROI_MARGIN):
+    """Clip an expanded (x, y, w, h) ROI to the frame as (x0, y0, x1, y1), or None"""
+    x, y, w, h = (int(v) for v in roi)
+    if w <= 0 or h <= 0:
+        return None
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(shape[1], x + w + dx), min(shape[0], y + h + dy)
+    if x1 - x0 < FACE_ROI_MIN_SIZE or y1 - y0 < FACE_ROI_MIN_SIZE:
+        return None
+    return x0, y0, x1, y1
+
+
+def detect_faces(gray, roi=None):
+    """Run the shared Haar cascade on a grayscale frame, returning (faces, roi_hit)
+
+    With a ROI only the window around it is searched; the full frame is
+    searched when there is no ROI or no face inside it.
+    """
+    cascade = get_face_cascade()
+    window = roi_window(roi, gray.shape) if roi is not None else None
+    if window is not None:
+        x0, y0, x1, y1 = window
+        faces = cascade.detectMultiScale(gray[y0:y1, x0:x1], 1.3, 5)
+        if len(faces):
+            return faces + np.array([x0, y0, 0, 0]), True
+    return cascade.detectMultiScale(gray, 1.3, 5), False
+
+
+def crop_face(gray, box):
+    """Cut a face out of a grayscale frame as a normalized 48x48 float32 array"""
+    x, y, w, h = (int(v) for v in box)
+    face = gray[y:y + h, x:x + w]
+    face = cv2.resize(face, (FACE_INPUT_SIZE, FACE_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+    return face.astype(np.float32) / 255.0
+
+
+def classify_faces(faces):
+    """Classify a (N, 48, 48) batch of face crops in one forward pass
+
+    Returns a list of (dominant_emotion, emotion_scores) tuples with scores
+    in percent, matching what DeepFace.analyze reported.
+    """
+    model = get_emotion_model().model
+    predictions = np.asarray(model(faces[..., np.newaxis], training=False))
+
+    results = []
+    for row in predictions:
+        scores = 100.0 * row / row.sum()
+        emotion_scores = {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+        results.append((EMOTION_LABELS[int(np.argmax(row))], emotion_scores))
+    return results
+
+
+def analyze_image_bytes(image_bytes, classify=None, previous_signature=None, roi=None):
+    """Decode, detect and classify one frame
+
+    The frame is decoded straight to grayscale, the face is detected once
+    (inside `roi` if given) and only its 48x48 crop reaches the classifier.
+
+    Returns a plain, picklable dict so it can cross a process boundary:
+    {'face': [x, y, w, h] or None, 'faces': [[x, y, w, h], ...],
+     'emotion': str, 'scores': {label: percent}, 'signature': bytes,
+     'roiHit': bool, 'timings': {stage: ms}}. Only the first face is classified. If the
+    frame matches previous_signature the detector and classifier are
+    skipped and {'unchanged': True, ...} is returned instead.
+    """
+    timings = {}
+    started = time.perf_counter()
+    gray = decode_image_bytes(image_bytes, grayscale=True)
+    signature = frame_signature(gray)
+    timings['decode'] = _elapsed_ms(started)
+    if previous_signature is not None and not frame_changed(previous_signature, signature):
+        return {'unchanged': True, 'signature': signature, 'timings': timings}
+
+    started = time.perf_counter()
+    faces, roi_hit = detect_faces(gray, roi)
+    timings['detect'] = _elapsed_ms(started)
+    if len(faces) == 0:
+        return {'face': None, 'signature': signature, 'roiHit': False, 'timings': timings}
+
+    started = time.perf_counter()
+    x, y, w, h = (int(v) for v in faces[0])
+    face = crop_face(gray, (x, y, w, h))
+    if classify:
+        dominant_emotion, emotion_scores = classify(face)
+    else:
+        dominant_emotion, emotion_scores = classify_faces(face[np.newaxis])[0]
+    timings['classify'] = _elapsed_ms(started)
+
+    return {'face': [x, y, w, h], 'faces': [[int(v) for v in box] for box in faces],
+            'emotion': dominant_emotion, 'scores': emotion_scores,
+            'signature': signature, 'roiHit': roi_hit, 'timings': timings}
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+# ============================================================
+# MICRO-BATCHING
+# ============================================================
+
+class EmotionBatcher:
+    """Collects face crops from concurrent requests into one model batch
+
+    Callers block on classify(); a single worker thread waits up to
+    max_wait_ms for more crops (or until max_batch_size is reached) and
+    runs them through the model together.
+    """
+
+    def __init__(self, classify_batch=classify_faces, max_batch_size=16, max_wait_ms=5.0):
+        self.classify_batch = classify_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created after gunicorn forks
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='emotion-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, face):
+        """Queue one 48x48 face crop and return a Future for its result"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((face, future))
+        return future
+
+    def classify(self, face, timeout=30):
+        """Classify one face crop, sharing the forward pass with concurrent callers"""
+        return self.submit(face).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.classify_batch(np.stack([face for face, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+            self._batches += 1
+            self._items += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+
+    def stats(self):
+        """Batch counts for monitoring"""
+        return {
+            'maxBatchSize': self.max_batch_size,
+            'maxWaitMs': self.max_wait * 1000.0,
+            'batches': self._batches,
+            'items': self._items,
+            'averageBatchSize': round(self._items / self._batches, 2) if self._batches else 0,
+            'largestBatch': self._largest_batch,
+            'queueDepth': self._queue.qsize()
+        }
@@ -0,0 +1,98 @@
+"""
+VibeSync emotion smoothing - per-user temporal state for /detect_emotion.
+
+Keeps, for each user, the signature of the last analyzed frame, the last
+response and an exponential moving average of the emotion scores. When the
+next webcam frame is visually the same, the previous response is reused and
+no inference or emotion_history row is produced.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class EmotionTracker:
+    """Thread-safe, LRU-bounded per-user emotion state"""
+
+    def __init__(self, alpha=0.4, max_reuse_seconds=15.0, reset_after_seconds=60.0, max_users=10000):
+        self.alpha = min(max(float(alpha), 0.0), 1.0)
+        self.max_reuse_seconds = float(max_reuse_seconds)
+        self.reset_after_seconds = float(reset_after_seconds)
+        self.max_users = max(1, int(max_users))
+
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self._frames = 0
+        self._skipped = 0
+
+    def _get(self, user_id):
+        state = self._users.get(user_id)
+        if state and time.monotonic() - state['seenAt'] > self.reset_after_seconds:
+            del self._users[user_id]
+            return None
+        return state
+
+    def reusable_signature(self, user_id):
+        """Signature to compare the next frame against, or None to force inference"""
+        with self._lock:
+            state = self._get(user_id)
+            if not state or state['response'] is None:
+                return None
+            if time.monotonic() - state['inferredAt'] > self.max_reuse_seconds:
+                return None
+            return state['signature']
+
+    def reuse(self, user_id):
+        """Return the previous response and count the skipped frame, or None
+
+        Nothing is counted when there is no response to reuse: the caller
+        then runs inference and record() counts the frame.
+        """
+        with self._lock:
+            state = self._get(user_id)
+            if not state or state['response'] is None:
+                return None
+            self._frames += 1
+            self._skipped += 1
+            state['seenAt'] = time.monotonic()
+            return state['response']
+
+    def smooth(self, user_id, scores):
+        """Blend new scores into the user's moving average and return it"""
+        with self._lock:
+            state = self._get(user_id)
+            previous = state['ema'] if state else None
+            if not previous:
+                return dict(scores)
+            return {
+                label: self.alpha * score + (1 - self.alpha) * previous.get(label, score)
+                for label, score in scores.items()
+            }
+
+    def record(self, user_id, signature, ema, response):
+        """Store the outcome of a real inference (response=None: no face)"""
+        now = time.monotonic()
+        with self._lock:
+            self._frames += 1
+            previous = self._get(user_id)
+            self._users[user_id] = {
+                'signature': signature,
+                'ema': ema if ema is not None else (previous['ema'] if previous else None),
+                'response': response,
+                'inferredAt': now,
+                'seenAt': now
+            }
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def stats(self):
+        """Skip ratio for monitoring"""
+        with self._lock:
+            return {
+                'frames': self._frames,
+                'skipped': self._skipped,
+                'skipRatio': round(self._skipped / self._frames, 4) if self._frames else 0.0,
+                'trackedUsers': len(self._users),
+                'alpha': self.alpha
+            }
@@ -0,0 +1,47 @@
+"""
+VibeSync face landmarks - the 68-point overlay drawn on the webcam feed.
+
+The points are a fixed template (face outline, eyebrows, nose, eyes and
+mouth) expressed in face-box coordinates, precomputed once at import. Each
+request only applies one affine transform per face box: x + u*w, y + v*h,
+vectorized over all faces and points. NumPy only, so it is safe to use in
+web workers that never load OpenCV.
+"""
+import numpy as np
+
+
+def _ellipse(cx, cy, rx, ry, count, start=0.0, stop=2 * np.pi, closed=False, phase_y=0.0):
+    angles = start + (stop - start) * np.arange(count) / (count - 1 if closed else count)
+    return np.column_stack([cx + rx * np.cos(angles), cy + ry * np.sin(angles + phase_y)])
+
+
+def _line(u0, v0, du, dv, count):
+    steps = np.arange(count)
+    return np.column_stack([u0 + du * steps, v0 + dv * steps])
+
+
+# (68, 2) array of (u, v) in [0, 1] face-box units, in the usual 68-point order
+LANDMARK_TEMPLATE = np.vstack([
+    _ellipse(0.5, 0.5, 1 / 2.2, 1 / 1.5, 17, np.pi, 2 * np.pi, closed=True, phase_y=-5 * np.pi / 6),  # outline 0-16
+    _line(0.25, 0.3, 0.05, 0.0, 5),      # left eyebrow 17-21
+    _line(0.55, 0.3, 0.05, 0.0, 5),      # right eyebrow 22-26
+    _line(0.5, 0.35, 0.0, 0.08, 4),      # nose bridge 27-30
+    _line(0.35, 0.6, 0.075, 0.0, 5),     # nose base 31-35
+    _ellipse(0.3, 0.4, 0.05, 0.03, 6),   # left eye 36-41
+    _ellipse(0.7, 0.4, 0.05, 0.03, 6),   # right eye 42-47
+    _ellipse(0.5, 0.75, 0.15, 0.06, 12),  # outer mouth 48-59
+    _ellipse(0.5, 0.75, 0.1, 0.04, 8),   # inner mouth 60-67
+])
+LANDMARK_TEMPLATE.setflags(write=False)
+
+
+def landmarks_for_faces(boxes):
+    """Landmarks for (N, 4) face boxes [x, y, w, h] as an (N, 68, 2) int array"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    points = boxes[:, np.newaxis, :2] + LANDMARK_TEMPLATE[np.newaxis] * boxes[:, np.newaxis, 2:]
+    return points.astype(np.int32)
+
+
+def landmarks_as_dicts(points):
+    """One face's (68, 2) landmarks as [{'x': ..., 'y': ...}, ...]"""
+    return [{'x': x, 'y': y} for x, y in points.tolist()]
@@ -0,0 +1,211 @@
+"""
+VibeSync favorites cache - each user's known favorite flags, per song ID.
+
+Song grids ask "which of these songs are favorites?" for dozens of cards at
+a time. lookup() answers the IDs it has seen before from memory and sends
+only the unknown ones to the loader - one `song_id = ANY(%s)` query on the
+favorites(user_id, song_id) key - then remembers those answers too.
+
+add_favorite/remove_favorite call invalidate(user_id) after their commit.
+With several gunicorn workers, FAVORITES_CACHE_INVALIDATION_LOG (a local
+file shared by all of them) receives one line per invalidated user. Each
+worker checks the file size at most every sync_interval_ms and reads only
+the new lines, dropping those users' entries, so a toggle is visible
+everywhere within that interval without a file read per lookup. The log is
+rotated once it passes max_log_bytes; a worker that sees the rotation
+drops all of its entries. Entries are also LRU + TTL bounded.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class FavoritesCache:
+    """Thread-safe per-user {song_id: favorited} cache"""
+
+    def __init__(self, max_users=10000, ttl_seconds=60.0, invalidation_log=None,
+                 sync_interval_ms=250, max_songs_per_user=5000, max_log_bytes=1 << 20):
+        self.max_users = max(1, int(max_users))
+        self.ttl = float(ttl_seconds)
+        self.invalidation_log = invalidation_log or None
+        self.sync_interval = max(0, int(sync_interval_ms)) / 1000
+        self.max_songs_per_user = max(1, int(max_songs_per_user))
+        self.max_log_bytes = int(max_log_bytes)
+        if self.invalidation_log:
+            os.makedirs(os.path.dirname(os.path.abspath(self.invalidation_log)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> [expires_at, {song_id: bool}]
+        self._loading = {}  # user_id -> [loads in flight, changed while loading]
+        self._log_position = self._log_end()  # (inode, offset) read up to
+        self._next_sync = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    # --------------------------------------------------------
+    # Shared invalidation log across worker processes
+    # --------------------------------------------------------
+
+    def _log_end(self):
+        if not self.invalidation_log:
+            return None
+        try:
+            st = os.stat(self.invalidation_log)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size
+
+    def _append_to_log(self, user_id):
+        if not self.invalidation_log:
+            return
+        try:
+            fd = os.open(self.invalidation_log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, f'{int(user_id)}\n'.encode())  # One small O_APPEND write: not interleaved
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if size > self.max_log_bytes:
+                tmp_path = f'{self.invalidation_log}.{os.getpid()}.{threading.get_ident()}.tmp'
+                open(tmp_path, 'w').close()
+                os.replace(tmp_path, self.invalidation_log)  # Atomic on POSIX
+        except OSError as e:
+            print(f"⚠️ Could not update favorites cache invalidation log: {e}")
+
+    def _drop(self, user_id):
+        self._entries.pop(user_id, None)
+        if user_id in self._loading:
+            self._loading[user_id][1] = True
+
+    def _drop_all(self):
+        self._entries.clear()
+        for loading in self._loading.values():
+            loading[1] = True
+
+    def _sync(self):
+        """Apply other workers' invalidations (at most once per sync interval); call with the lock held"""
+        now = time.monotonic()
+        if not self.invalidation_log or now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+
+        end = self._log_end()
+        if end is None or end == self._log_position:
+            return
+        inode, offset = self._log_position or (None, 0)
+        if end[0] != inode or end[1] < offset:
+            # Created or rotated: lines written before the switch may be missed
+            if inode is not None:
+                self._drop_all()
+            inode, offset = end[0], 0
+
+        try:
+            with open(self.invalidation_log, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != inode:
+                    return  # Rotated again since the stat; next sync
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return
+        complete = data[:data.rfind(b'\n') + 1]  # A line still being written is read next time
+        for line in complete.split():
+            if line.isdigit():
+                self._drop(int(line))
+        self._log_position = (inode, offset + len(complete))
+
+    # --------------------------------------------------------
+    # Cache operations
+    # --------------------------------------------------------
+
+    def _entry(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[user_id]
+            entry = None
+        return entry
+
+    def lookup(self, user_id, song_ids, loader):
+        """Return {song_id: favorited} for song_ids
+
+        loader(ids) returns the favorited subset of ids and is only called
+        for IDs this worker has not cached. Its answers are not cached when
+        the user's favorites changed while it ran.
+        """
+        song_ids = list(dict.fromkeys(song_ids))
+        if not self.enabled:
+            favorited = set(loader(song_ids)) if song_ids else set()
+            return {song_id: song_id in favorited for song_id in song_ids}
+
+        with self._lock:
+            self._sync()
+            entry = self._entry(user_id)
+            known = entry[1] if entry is not None else {}
+            result = {song_id: known[song_id] for song_id in song_ids if song_id in known}
+            missing = [song_id for song_id in song_ids if song_id not in result]
+            self._hits += len(result)
+            self._misses += len(missing)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            if not missing:
+                return result
+            loading = self._loading.setdefault(user_id, [0, False])
+            loading[0] += 1
+
+        try:
+            favorited = set(loader(missing))
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self._loading[user_id]
+
+        answers = {song_id: song_id in favorited for song_id in missing}
+        result.update(answers)
+        with self._lock:
+            if not loading[1]:
+                entry = self._entry(user_id)
+                if entry is None or len(entry[1]) + len(answers) > self.max_songs_per_user:
+                    entry = [time.monotonic() + self.ttl, {}]
+                    self._entries[user_id] = entry
+                entry[1].update(answers)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return result
+
+    def invalidate(self, user_id=None):
+        """Drop one user's entry in every worker (after a committed change), or this worker's entries"""
+        if user_id is not None:
+            self._append_to_log(user_id)
+        with self._lock:
+            self._invalidations += 1
+            if user_id is None:
+                self._drop_all()
+            else:
+                self._drop(user_id)
+
+    def stats(self):
+        """Hit/miss counters (per song ID looked up) for monitoring"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'users': len(self._entries),
+                'maxUsers': self.max_users,
+                'ttlSeconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRatio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'invalidationLog': self.invalidation_log,
+                'syncIntervalMs': int(self.sync_interval * 1000)
+            }
@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for VibeSync (picked up automatically from the
+working directory).
+"""
+import os
+import sys
+
+
+def post_fork(server, worker):
+    """Warm the face detector and emotion model in each freshly forked worker"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.media_jobs.start()  # preload_app: threads don't survive the fork
+
+    if os.getenv('VIBESYNC_MODEL_WARMUP', 'startup').lower() != 'post_fork':
+        return
+    if os.getenv('INFERENCE_MODE', 'inline').lower() != 'inline':
+        return  # The inference service warms its own workers
+
+    from model_registry import registry
+    registry.warm_up_in_background()
+    server.log.info(f"Worker {worker.pid}: model warm-up started")
+
+
+def worker_exit(server, worker):
+    """Write out buffered emotion_history / recently_played rows"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.history_writer.close()
@@ -0,0 +1,341 @@
+"""
+VibeSync history storage - partitioning, retention and daily rollups.
+
+emotion_history and recently_played are range-partitioned by month on their
+timestamp column (emotion_history_p202501, ...), plus a DEFAULT partition
+for anything outside the prepared months. When a month's partition is
+created later, its rows are moved out of DEFAULT. The only index is
+(user_id, <time> DESC), which serves the "latest 50" lists and the per-user
+chart ranges; time filters prune whole partitions.
+
+The maintenance job keeps the hot tables small: partitions whose rows are
+all older than HISTORY_RETENTION_DAYS are compacted into per-user daily
+aggregates (emotion_history_daily, recently_played_daily) and dropped, which
+is a cheap metadata operation instead of a large DELETE. Run it daily:
+
+    python history_storage.py           # e.g. from cron
+    POST /api/admin/maintenance/history  # admin only
+
+Startup (init_postgres) only creates missing tables and partitions. Tables
+from before partitioning keep working as plain tables, with their
+(user_id, <time>) index, until they are migrated, which copies every row, so run it once from a shell rather
+than inside a worker's boot:
+
+    python history_storage.py migrate
+"""
+import os
+from datetime import date, datetime, timedelta
+
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))  # 0 keeps everything
+HISTORY_PARTITIONS_AHEAD = int(os.getenv('HISTORY_PARTITIONS_AHEAD', '2'))  # Months
+
+# Serializes migrations and maintenance across workers and the cron job
+_ADVISORY_LOCK_KEY = 0x76696265  # 'vibe'
+
+HISTORY_TABLES = {
+    'emotion_history': {
+        'time_column': 'detected_at',
+        'columns': ('id', 'user_id', 'email', 'emotion', 'confidence', 'detected_at'),
+        'definition': '''
+            id SERIAL,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            email VARCHAR(255) NOT NULL,
+            emotion VARCHAR(50) NOT NULL,
+            confidence REAL NOT NULL,
+            detected_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, detected_at)
+        ''',
+        'index': 'CREATE INDEX IF NOT EXISTS idx_emotion_user_detected_desc ON emotion_history (user_id, detected_at DESC)',
+        'unpartitioned_index': 'CREATE INDEX IF NOT EXISTS idx_emotion_user_detected ON emotion_history (user_id, detected_at)',
+        'rollup_table': '''
+            CREATE TABLE IF NOT EXISTS emotion_history_daily (
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                day DATE NOT NULL,
+                emotion VARCHAR(50) NOT NULL,
+                detections INTEGER NOT NULL,
+                avg_confidence REAL NOT NULL,
+                PRIMARY KEY (user_id, day, emotion)
+            )
+        ''',
+        'rollup': '''
+            INSERT INTO emotion_history_daily (user_id, day, emotion, detections, avg_confidence)
+            SELECT user_id, detected_at::date, emotion, COUNT(*), AVG(confidence)
+            FROM {source}
+            WHERE {condition}
+            GROUP BY 1, 2, 3
+            ON CONFLICT (user_id, day, emotion) DO UPDATE SET
+                avg_confidence = (emotion_history_daily.avg_confidence * emotion_history_daily.detections
+                                  + EXCLUDED.avg_confidence * EXCLUDED.detections)
+                                 / (emotion_history_daily.detections + EXCLUDED.detections),
+                detections = emotion_history_daily.detections + EXCLUDED.detections
+        '''
+    },
+    'recently_played': {
+        'time_column': 'played_at',
+        'columns': ('id', 'user_id', 'email', 'song_id', 'song_title', 'artist', 'played_at'),
+        'definition': '''
+            id SERIAL,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            email VARCHAR(255) NOT NULL,
+            song_id VARCHAR(255) NOT NULL,
+            song_title VARCHAR(500) NOT NULL,
+            artist VARCHAR(500) NOT NULL,
+            played_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, played_at)
+        ''',
+        'index': 'CREATE INDEX IF NOT EXISTS idx_recent_user_played_desc ON recently_played (user_id, played_at DESC)',
+        'unpartitioned_index': 'CREATE INDEX IF NOT EXISTS idx_recent_user_played ON recently_played (user_id, played_at)',
+        'rollup_table': '''
+            CREATE TABLE IF NOT EXISTS recently_played_daily (
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                day DATE NOT NULL,
+                song_id VARCHAR(255) NOT NULL,
+                song_title VARCHAR(500) NOT NULL,
+                artist VARCHAR(500) NOT NULL,
+                plays INTEGER NOT NULL,
+                PRIMARY KEY (user_id, day, song_id)
+            )
+        ''',
+        'rollup': '''
+            INSERT INTO recently_played_daily (user_id, day, song_id, song_title, artist, plays)
+            SELECT user_id, played_at::date, song_id, MAX(song_title), MAX(artist), COUNT(*)
+            FROM {source}
+            WHERE {condition}
+            GROUP BY 1, 2, 3
+            ON CONFLICT (user_id, day, song_id) DO UPDATE SET
+                plays = recently_played_daily.plays + EXCLUDED.plays
+        '''
+    }
+}
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def _relkind(cursor, name):
+    cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', (name,))
+    row = cursor.fetchone()
+    return row['relkind'] if row else None
+
+
+def _lock(cursor, wait=True):
+    """Take the history lock for this transaction; False if busy and not waiting"""
+    if wait:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (_ADVISORY_LOCK_KEY,))
+        return True
+    cursor.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (_ADVISORY_LOCK_KEY,))
+    return cursor.fetchone()['locked']
+
+
+# ============================================================
+# PARTITIONS
+# ============================================================
+
+def _create_partition(cursor, table, month):
+    """Create one monthly partition, moving its rows out of the DEFAULT partition
+
+    Postgres refuses to add a partition while DEFAULT holds rows in its
+    range (e.g. a month that started before anyone prepared it), so those
+    rows are moved with DEFAULT detached.
+    """
+    partition = _partition_name(table, month)
+    time_column = HISTORY_TABLES[table]['time_column']
+    columns = ', '.join(HISTORY_TABLES[table]['columns'])
+    bounds = {'start': month, 'end': _next_month(month)}
+    in_month = f'{time_column} >= %(start)s AND {time_column} < %(end)s'
+
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {in_month}) AS stray', bounds)
+    if not cursor.fetchone()['stray']:
+        cursor.execute(f'CREATE TABLE {partition} PARTITION OF {table} FOR VALUES FROM (%(start)s) TO (%(end)s)', bounds)
+        return
+
+    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {table}_default')
+    cursor.execute(f'CREATE TABLE {partition} PARTITION OF {table} FOR VALUES FROM (%(start)s) TO (%(end)s)', bounds)
+    cursor.execute(f'INSERT INTO {partition} ({columns}) SELECT {columns} FROM {table}_default WHERE {in_month}', bounds)
+    moved = cursor.rowcount
+    cursor.execute(f'DELETE FROM {table}_default WHERE {in_month}', bounds)
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {table}_default DEFAULT')
+    print(f"✓ Created {partition} ({moved} rows moved from {table}_default)")
+
+
+def ensure_partitions(cursor, table, first_month, last_month):
+    """Create the monthly partitions first_month..last_month (inclusive) if missing"""
+    month = _month_start(first_month)
+    while month <= last_month:
+        if _relkind(cursor, _partition_name(table, month)) is None:
+            _create_partition(cursor, table, month)
+        month = _next_month(month)
+
+
+def _migrate_unpartitioned(cursor, table, spec):
+    """Move an existing plain table into a new partitioned one"""
+    legacy = f'{table}_unpartitioned'
+    time_column = spec['time_column']
+    columns = ', '.join(spec['columns'])
+
+    # Free the names the new table will use for its key and sequence
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+    cursor.execute(f'ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey')
+    cursor.execute(f'ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {legacy}_id_seq')
+
+    cursor.execute(f'CREATE TABLE {table} ({spec["definition"]}) PARTITION BY RANGE ({time_column})')
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT')
+
+    cursor.execute(f'SELECT MIN({time_column}) AS oldest, COUNT(*) AS count FROM {legacy}')
+    stats = cursor.fetchone()
+    if stats['oldest'] is not None:
+        ensure_partitions(cursor, table, stats['oldest'].date(), date.today())
+
+    cursor.execute(f'''
+        INSERT INTO {table} ({columns})
+        SELECT {columns.replace(time_column, f'COALESCE({time_column}, CURRENT_TIMESTAMP)')}
+        FROM {legacy}
+    ''')
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}")
+    cursor.execute(f'DROP TABLE {legacy}')
+    print(f"✓ Partitioned {table} ({stats['count']} rows migrated)")
+
+
+def ensure_history_storage(conn, months_ahead=HISTORY_PARTITIONS_AHEAD, wait=True):
+    """Create the partitioned history tables, upcoming partitions, index and rollup tables
+
+    Unpartitioned tables are left alone (see migrate_history_storage). With
+    wait=False, returns False instead of waiting when a migration or
+    maintenance run holds the lock.
+    """
+    with conn.cursor() as cursor:
+        if not _lock(cursor, wait):
+            conn.rollback()
+            print("⚠️ History storage is busy (migration or maintenance running), skipped setup")
+            return False
+        this_month = _month_start(date.today())
+        last_month = this_month
+        for _ in range(months_ahead):
+            last_month = _next_month(last_month)
+
+        for table, spec in HISTORY_TABLES.items():
+            cursor.execute(spec['rollup_table'])
+            relkind = _relkind(cursor, table)
+            if relkind == 'r':
+                cursor.execute(spec['unpartitioned_index'])  # Chart range scans until migrated
+                print(f"⚠️ {table} is not partitioned yet - run: python history_storage.py migrate")
+                continue
+            if relkind is None:
+                cursor.execute(
+                    f'CREATE TABLE {table} ({spec["definition"]}) PARTITION BY RANGE ({spec["time_column"]})'
+                )
+                cursor.execute(f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT')
+
+            ensure_partitions(cursor, table, this_month, last_month)
+            cursor.execute(spec['index'])
+    conn.commit()
+    return True
+
+
+def migrate_history_storage(conn, months_ahead=HISTORY_PARTITIONS_AHEAD):
+    """Move unpartitioned history tables into partitioned ones; returns the tables migrated
+
+    Copies every row in one transaction, blocking writes to the table until
+    it commits. Meant for `python history_storage.py migrate`.
+    """
+    migrated = []
+    with conn.cursor() as cursor:
+        _lock(cursor)
+        for table, spec in HISTORY_TABLES.items():
+            if _relkind(cursor, table) == 'r':
+                _migrate_unpartitioned(cursor, table, spec)
+                migrated.append(table)
+    conn.commit()
+    ensure_history_storage(conn, months_ahead)
+    return migrated
+
+
+# ============================================================
+# RETENTION AND ROLLUP
+# ============================================================
+
+def _monthly_partitions(cursor, table):
+    cursor.execute('''
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+    ''', (table,))
+    prefix = f'{table}_p'
+    partitions = []
+    for row in cursor.fetchall():
+        suffix = row['name'][len(prefix):]
+        if row['name'].startswith(prefix) and suffix.isdigit() and len(suffix) == 6:
+            partitions.append((date(int(suffix[:4]), int(suffix[4:]), 1), row['name']))
+    return sorted(partitions)
+
+
+def run_history_maintenance(conn, retention_days=HISTORY_RETENTION_DAYS, months_ahead=HISTORY_PARTITIONS_AHEAD):
+    """Prepare upcoming partitions, then roll up and drop the expired ones
+
+    Returns {table: {'rolledUpRows': n, 'droppedPartitions': [...]}}.
+    """
+    ensure_history_storage(conn, months_ahead)
+    summary = {}
+    if retention_days <= 0:
+        return summary
+
+    cutoff = datetime.combine(date.today() - timedelta(days=retention_days), datetime.min.time())
+    with conn.cursor() as cursor:
+        _lock(cursor)
+        for table, spec in HISTORY_TABLES.items():
+            if _relkind(cursor, table) != 'p':
+                continue  # Not migrated yet
+            time_column = spec['time_column']
+            rolled_up = 0
+            dropped = []
+
+            # Whole months past the cutoff: compact, then drop the partition
+            for month, partition in _monthly_partitions(cursor, table):
+                if datetime.combine(_next_month(month), datetime.min.time()) > cutoff:
+                    continue
+                cursor.execute(spec['rollup'].format(source=partition, condition='TRUE'))
+                cursor.execute(f'SELECT COUNT(*) AS count FROM {partition}')
+                rolled_up += cursor.fetchone()['count']
+                cursor.execute(f'DROP TABLE {partition}')
+                dropped.append(partition)
+
+            # Stray old rows that landed in the DEFAULT partition
+            condition = f'{time_column} < %(cutoff)s'
+            cursor.execute(spec['rollup'].format(source=f'{table}_default', condition=condition), {'cutoff': cutoff})
+            cursor.execute(f'DELETE FROM {table}_default WHERE {condition}', {'cutoff': cutoff})
+            rolled_up += cursor.rowcount
+
+            summary[table] = {'rolledUpRows': rolled_up, 'droppedPartitions': dropped}
+    conn.commit()
+    return summary
+
+
+if __name__ == '__main__':
+    import sys
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    with psycopg2.connect(os.environ['DATABASE_URL'], sslmode='require', cursor_factory=RealDictCursor) as conn:
+        if sys.argv[1:] == ['migrate']:
+            from admin_stats import ensure_stat_counters
+
+            migrated = migrate_history_storage(conn)
+            ensure_stat_counters(conn)  # The counting triggers went with the old tables
+            print(f"✓ Migrated: {', '.join(migrated)}" if migrated else "✓ History tables are already partitioned")
+            sys.exit(0)
+        for table, result in run_history_maintenance(conn).items():
+            print(f"✓ {table}: {result['rolledUpRows']} rows rolled up, "
+                  f"{len(result['droppedPartitions'])} partitions dropped")
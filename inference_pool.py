@@ -0,0 +1,371 @@
+"""
+VibeSync inference backends - keep TensorFlow out of the web workers.
+
+INFERENCE_MODE selects where /detect_emotion frames are analyzed:
+
+  inline   run the pipeline inside the web worker (micro-batched)
+  service  send frames to a local inference service over a UNIX socket
+
+The service owns a pool of inference processes sized independently of the
+number of HTTP workers. Start it next to gunicorn:
+
+    python inference_pool.py            # INFERENCE_WORKERS defaults to the core count
+
+Requests are pickles, so only holders of the shared key may connect. Set
+INFERENCE_AUTHKEY for the service and the web workers, or leave it unset
+and the service writes a random key to INFERENCE_AUTHKEY_FILE (mode 0600)
+for web workers running as the same user. The socket is 0600 as well.
+Web workers wait at most INFERENCE_TIMEOUT_SECONDS for an answer, so a
+hung service makes /detect_emotion return 503 instead of tying up threads.
+
+This module only imports the ML stack inside the inline backend and the pool
+processes, so web workers in service mode never load TensorFlow or OpenCV.
+"""
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client, Listener
+
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'inline').lower()
+INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET', '/tmp/vibesync-inference.sock')
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+INFERENCE_AUTHKEY = os.getenv('INFERENCE_AUTHKEY')
+INFERENCE_AUTHKEY_FILE = os.getenv('INFERENCE_AUTHKEY_FILE', INFERENCE_SOCKET + '.key')
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv('INFERENCE_TIMEOUT_SECONDS', '10'))
+
+# Requests are (image_bytes, previous_signature, roi) tuples; None is a health-check ping
+_PING = None
+
+
+def read_authkey(create=False):
+    """The service key: INFERENCE_AUTHKEY, else INFERENCE_AUTHKEY_FILE (created if asked)"""
+    if INFERENCE_AUTHKEY:
+        return INFERENCE_AUTHKEY.encode()
+    try:
+        with open(INFERENCE_AUTHKEY_FILE) as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+                raise PermissionError(f'{INFERENCE_AUTHKEY_FILE} must be owned by this user with mode 0600')
+            return f.read().strip().encode()
+    except FileNotFoundError:
+        if not create:
+            raise
+    key = secrets.token_hex(32)
+    # O_EXCL + 0600: never reuse or expose a file someone else prepared
+    fd = os.open(INFERENCE_AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    print(f"✓ Wrote a new inference service key to {INFERENCE_AUTHKEY_FILE}")
+    return key.encode()
+
+
+class StageTimings:
+    """Per-stage pipeline timings (decode/detect/classify/total) and ROI hits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._roi_requests = 0
+        self._roi_hits = 0
+
+    def record(self, analysis, roi=None):
+        with self._lock:
+            for stage, ms in analysis.get('timings', {}).items():
+                count, total, peak = self._stages.get(stage, (0, 0.0, 0.0))
+                self._stages[stage] = (count + 1, total + ms, max(peak, ms))
+            if roi is not None and 'roiHit' in analysis:
+                self._roi_requests += 1
+                self._roi_hits += bool(analysis['roiHit'])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stages': {
+                    stage: {'count': count, 'avgMs': round(total / count, 3), 'maxMs': round(peak, 3)}
+                    for stage, (count, total, peak) in self._stages.items()
+                },
+                'roiRequests': self._roi_requests,
+                'roiHitRatio': round(self._roi_hits / self._roi_requests, 4) if self._roi_requests else 0.0
+            }
+
+
+def _timed(timings, roi, analyze):
+    """Run analyze(), add its wall time as the 'total' stage and record it"""
+    started = time.perf_counter()
+    analysis = analyze()
+    analysis.setdefault('timings', {})['total'] = round((time.perf_counter() - started) * 1000, 3)
+    timings.record(analysis, roi)
+    return analysis
+
+
+# ============================================================
+# INLINE BACKEND (in the web worker)
+# ============================================================
+
+class InlineInference:
+    """Runs the emotion pipeline in this process, batching concurrent requests"""
+
+    mode = 'inline'
+
+    def __init__(self, max_batch_size=16, max_wait_ms=5.0):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._batcher = None
+        self._lock = threading.Lock()
+        self.timings = StageTimings()
+
+    def _get_batcher(self):
+        if self._batcher is None:
+            with self._lock:
+                if self._batcher is None:
+                    from emotion_pipeline import EmotionBatcher
+                    self._batcher = EmotionBatcher(max_batch_size=self.max_batch_size,
+                                                   max_wait_ms=self.max_wait_ms)
+        return self._batcher
+
+    def analyze(self, image_bytes, previous_signature=None, roi=None):
+        """Analyze one encoded frame; see emotion_pipeline.analyze_image_bytes"""
+        from emotion_pipeline import analyze_image_bytes
+        classify = self._get_batcher().classify
+        return _timed(self.timings, roi,
+                      lambda: analyze_image_bytes(image_bytes, classify, previous_signature, roi))
+
+    def warm_up_in_background(self):
+        from model_registry import registry
+        return registry.warm_up_in_background()
+
+    def status(self):
+        from model_registry import registry
+        status = registry.status()
+        status['mode'] = self.mode
+        status['batching'] = self._batcher.stats() if self._batcher else None
+        status['timings'] = self.timings.stats()
+        return status
+
+
+# ============================================================
+# SERVICE BACKEND (client side, in the web worker)
+# ============================================================
+
+class InferenceTimeout(TimeoutError):
+    """The inference service did not answer within the timeout"""
+
+
+class InferenceServiceClient:
+    """Sends frames to the local inference service, one connection per thread"""
+
+    mode = 'service'
+
+    def __init__(self, address=INFERENCE_SOCKET, authkey=None, timeout=INFERENCE_TIMEOUT_SECONDS):
+        self.address = address
+        self.authkey = authkey  # None: read_authkey() on each new connection
+        self.timeout = timeout
+        self._local = threading.local()
+        self.timings = StageTimings()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, family='AF_UNIX', authkey=self.authkey or read_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _request(self, payload):
+        # Retry once on a fresh connection in case the service restarted
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send(payload)
+                if conn.poll(self.timeout):
+                    return conn.recv()
+            except (EOFError, OSError, multiprocessing.AuthenticationError):
+                self._drop_connection()
+                if attempt:
+                    raise
+                continue
+            # A late answer must not be read as the next request's, so drop the connection
+            self._drop_connection()
+            raise InferenceTimeout(f'No answer from the inference service within {self.timeout:g}s')
+
+    def analyze(self, image_bytes, previous_signature=None, roi=None):
+        """Analyze one encoded frame in the inference service"""
+        if not image_bytes:
+            raise ValueError('Empty image data')
+        payload = (bytes(image_bytes), previous_signature, tuple(roi) if roi is not None else None)
+        result = _timed(self.timings, roi, lambda: self._request(payload))
+        if 'error' in result:
+            raise RuntimeError(f"Inference service error: {result['error']}")
+        return result
+
+    def warm_up_in_background(self):
+        pass  # The service warms its own workers
+
+    def status(self):
+        try:
+            status = self._request(_PING)
+        except (EOFError, OSError, multiprocessing.AuthenticationError) as e:
+            status = {'ready': False, 'error': str(e)}
+        status['mode'] = self.mode
+        status['timings'] = self.timings.stats()
+        return status
+
+
+def create_inference_backend(mode=INFERENCE_MODE, **inline_options):
+    """Build the backend selected by INFERENCE_MODE"""
+    if mode == 'service':
+        return InferenceServiceClient()
+    if mode != 'inline':
+        print(f"⚠️ Unknown INFERENCE_MODE '{mode}', using inline")
+    return InlineInference(**inline_options)
+
+
+# ============================================================
+# INFERENCE SERVICE (server side)
+# ============================================================
+
+def _init_worker():
+    """Load and warm the models once in each pool process"""
+    from model_registry import registry
+    registry.warm_up()
+
+
+def _analyze_in_worker(image_bytes, previous_signature, roi):
+    from emotion_pipeline import analyze_image_bytes
+    return analyze_image_bytes(image_bytes, previous_signature=previous_signature, roi=roi)
+
+
+def _worker_ready():
+    return True  # Runs after _init_worker, so its completion means a warm worker
+
+
+class InferenceWorkers:
+    """The service's process pool, rebuilt when one of its processes dies
+
+    A ProcessPoolExecutor whose child crashed (OOM kill, segfault in native
+    code) stays broken for good. The request that hit it fails, the pool is
+    replaced and reports not-ready until a new worker has warmed up.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._ready = False
+        self._executor = None
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        # spawn, not fork: TensorFlow does not survive being forked
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        self._executor = executor
+        self._ready = False
+        executor.submit(_worker_ready).add_done_callback(lambda future: self._warmed(executor, future))
+
+    def _warmed(self, executor, future):
+        with self._lock:
+            if self._executor is executor and not future.cancelled() and future.exception() is None:
+                self._ready = True
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is not broken:
+                return  # Another request already replaced it
+            self.restarts += 1
+            print(f"⚠️ An inference worker died, restarting the pool (restart {self.restarts})")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._start()
+
+    def analyze(self, payload):
+        with self._lock:
+            executor = self._executor
+        try:
+            return executor.submit(_analyze_in_worker, *payload).result()
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise RuntimeError('Inference worker died; the pool is restarting') from None
+
+    def status(self):
+        with self._lock:
+            return {'ready': self._ready, 'workers': self.workers, 'restarts': self.restarts}
+
+    def shutdown(self):
+        with self._lock:
+            self._executor.shutdown(cancel_futures=True)
+
+
+def _handle_connection(conn, pool):
+    with conn:
+        while True:
+            try:
+                payload = conn.recv()
+            except (EOFError, OSError):
+                return
+
+            if payload == _PING:
+                conn.send(pool.status())
+                continue
+
+            try:
+                result = pool.analyze(payload)
+            except Exception as e:
+                result = {'error': str(e)}
+
+            try:
+                conn.send(result)
+            except OSError:
+                return
+
+
+def serve(address=INFERENCE_SOCKET, workers=INFERENCE_WORKERS):
+    """Run the inference service until interrupted"""
+    authkey = read_authkey(create=True)
+    if os.path.exists(address):
+        os.unlink(address)
+
+    pool = InferenceWorkers(workers)
+    # Bind under a 0177 umask so the socket never exists with looser permissions
+    old_umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    print(f"✓ Inference service listening on {address} with {workers} workers")
+
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            threading.Thread(
+                target=_handle_connection,
+                args=(conn, pool),
+                daemon=True
+            ).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,344 @@
+"""
+VibeSync media upload jobs - slow media uploads off the request thread.
+
+POST /api/songs/upload spools the submitted files to MEDIA_SPOOL_DIR and
+saves the song immediately, with URLs that serve the spooled copies
+(/media/spool/<job_id>/<file>), then queues a job. Background threads hand
+the files to the media storage backend (media_storage), and once every file
+has its final URL the song document is updated (mediaStatus 'ready').
+
+- A job is a directory holding job.json (status, attempts, per-file URLs)
+  and the spooled files. Status is read from disk, so any worker can answer
+  GET /api/media/jobs/<job_id>.
+- Failures are retried with exponential backoff (MEDIA_JOB_RETRY_SECONDS,
+  doubling, at most 5 minutes apart) up to MEDIA_JOB_MAX_ATTEMPTS times.
+  After that the job and the song's mediaStatus are 'failed' and the song
+  keeps its spooled URLs; POST /api/media/jobs/<job_id>/retry queues it
+  again. Files already stored are not sent twice.
+- With a transcode callable (audio_renditions.create_renditions), the job
+  also encodes the audio file into lower-bitrate renditions; they are kept
+  in job.json as 'renditions' / 'audioBitrate' and not redone on a retry.
+  Transcoding is best-effort: if it fails the song keeps only its original
+  audio (renditions []) and the job still completes.
+- A job is only worked on under an exclusive file lock. Every worker
+  process rescans the spool directory every MEDIA_JOB_RESCAN_SECONDS and
+  takes over unfinished jobs nobody holds, e.g. those of a worker that
+  died. Finished jobs are deleted after MEDIA_JOB_RETENTION_HOURS.
+"""
+import fcntl
+import heapq
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from media_storage import file_sha256
+
+_ACTIVE = ('queued', 'retrying', 'running')
+_MAX_BACKOFF = 300.0
+
+
+def _now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def _valid_job_id(job_id):
+    return len(job_id) == 16 and all(c in '0123456789abcdef' for c in job_id)
+
+
+class MediaJobQueue:
+    """Disk-backed upload jobs processed by a small thread pool"""
+
+    def __init__(self, storage, spool_dir, workers=2, max_attempts=5, retry_seconds=2.0,
+                 rescan_interval=60.0, retention_hours=24.0, on_complete=None, on_failed=None, transcode=None):
+        self.storage = storage
+        self.spool_dir = spool_dir
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_seconds = max(0.0, float(retry_seconds))
+        self.rescan_interval = max(1.0, float(rescan_interval))
+        self.retention = float(retention_hours) * 3600
+        self.on_complete = on_complete
+        self.on_failed = on_failed
+        self.transcode = transcode  # path -> (renditions, source kbps)
+
+        self._cond = threading.Condition()
+        self._heap = []  # (due wall-clock time, job_id)
+        self._scheduled = set()
+        self._threads = []
+        self._pid = None
+        self._next_rescan = 0.0
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._retries = 0
+        self._job_total = 0.0
+        self._last_job_ms = None
+
+    def start(self):
+        """Start this process's worker threads; they resume unfinished jobs"""
+        self._ensure_started()
+
+    def _ensure_started(self):
+        # Started lazily so each gunicorn worker gets its own threads
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._heap = []
+            self._scheduled = set()
+            self._next_rescan = 0.0  # Pick up jobs left by a previous process
+            self._reset_metrics()
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'media-jobs-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    # --------------------------------------------------------
+    # Job files
+    # --------------------------------------------------------
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.spool_dir, job_id)
+
+    def _read(self, job_id):
+        try:
+            with open(os.path.join(self._job_dir(job_id), 'job.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job):
+        job['updatedAt'] = _now()
+        path = os.path.join(self._job_dir(job['id']), 'job.json')
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)  # Readers never see a partial file
+
+    # --------------------------------------------------------
+    # Producers
+    # --------------------------------------------------------
+
+    def new_job_id(self):
+        """Reserve a job directory for spooling files into"""
+        job_id = secrets.token_hex(8)
+        os.makedirs(self._job_dir(job_id))
+        return job_id
+
+    def spool(self, job_id, file, field, folder):
+        """Save an uploaded FileStorage into the job; returns its asset entry"""
+        extension = os.path.splitext(secure_filename(file.filename))[1].lower()
+        filename = field + extension
+        file.save(os.path.join(self._job_dir(job_id), filename))
+        return {'field': field, 'folder': folder, 'file': filename, 'url': None}
+
+    def submit(self, job_id, song_id, assets):
+        """Queue the spooled assets of a song for upload"""
+        job = {
+            'id': job_id,
+            'songId': song_id,
+            'status': 'queued',
+            'attempts': 0,
+            'nextAttemptAt': None,
+            'assets': assets,
+            'error': None,
+            'createdAt': _now(),
+            'finishedAt': None
+        }
+        self._write(job)
+        self._ensure_started()
+        self._schedule(job_id, time.time())
+        return job
+
+    def discard(self, job_id):
+        """Delete a job that was never submitted"""
+        if _valid_job_id(job_id):
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def status(self, job_id):
+        """The job as stored on disk, or None"""
+        return self._read(job_id) if _valid_job_id(job_id) else None
+
+    def spooled_path(self, job_id, filename):
+        """Absolute path of a spooled file, or None"""
+        if not _valid_job_id(job_id) or filename != secure_filename(filename) or filename == 'job.json':
+            return None
+        path = os.path.join(self._job_dir(job_id), filename)
+        return path if os.path.isfile(path) else None
+
+    def retry(self, job_id):
+        """Queue a failed job again; returns the job, or None if not failed"""
+        job = self.status(job_id)
+        if job is None or job['status'] != 'failed':
+            return None
+        job.update(status='queued', attempts=0, nextAttemptAt=None, error=None)
+        self._write(job)
+        self._ensure_started()
+        self._schedule(job_id, time.time())
+        return job
+
+    # --------------------------------------------------------
+    # Workers
+    # --------------------------------------------------------
+
+    def _schedule(self, job_id, due):
+        with self._cond:
+            if job_id in self._scheduled:
+                return
+            self._scheduled.add(job_id)
+            heapq.heappush(self._heap, (due, job_id))
+            self._cond.notify()
+
+    def _rescan(self):
+        """Schedule unfinished jobs from disk and delete expired finished ones"""
+        try:
+            job_ids = [name for name in os.listdir(self.spool_dir) if _valid_job_id(name)]
+        except OSError:
+            return
+        for job_id in job_ids:
+            job = self._read(job_id)
+            if job is None:
+                continue  # Still being spooled, or never submitted
+            if job['status'] in _ACTIVE:
+                self._schedule(job_id, job.get('nextAttemptAt') or time.time())
+            elif job['status'] == 'done' and self.retention > 0:
+                path = os.path.join(self._job_dir(job_id), 'job.json')
+                if os.path.getmtime(path) < time.time() - self.retention:
+                    shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def _run(self):
+        while True:
+            rescan = False
+            with self._cond:
+                while True:
+                    now = time.time()
+                    if time.monotonic() >= self._next_rescan:
+                        self._next_rescan = time.monotonic() + self.rescan_interval
+                        rescan = True
+                        break
+                    if self._heap and self._heap[0][0] <= now:
+                        _, job_id = heapq.heappop(self._heap)
+                        self._scheduled.discard(job_id)
+                        break
+                    wait = self._next_rescan - time.monotonic()
+                    if self._heap:
+                        wait = min(wait, self._heap[0][0] - now)
+                    self._cond.wait(max(wait, 0.01))
+
+            if rescan:
+                self._rescan()
+                continue
+            try:
+                self._process(job_id)
+            except Exception as e:
+                print(f"❌ Media job {job_id} crashed: {e}")
+
+    def _process(self, job_id):
+        job_dir = self._job_dir(job_id)
+        if not os.path.isdir(job_dir):
+            return
+        with open(os.path.join(job_dir, 'lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # Another worker process has it
+
+            job = self._read(job_id)
+            if job is None or job['status'] not in _ACTIVE:
+                return
+            if (job.get('nextAttemptAt') or 0) > time.time():
+                self._schedule(job_id, job['nextAttemptAt'])  # Found early by a rescan
+                return
+
+            job.update(status='running', attempts=job['attempts'] + 1)
+            self._write(job)
+            started = time.monotonic()
+            with self._cond:
+                self._running += 1
+            try:
+                for asset in job['assets']:
+                    if asset['url'] is None:
+                        path = os.path.join(job_dir, asset['file'])
+                        asset['url'] = self.storage.save(path, asset['folder'], file_sha256(path))
+                        self._write(job)  # Stored files survive a retry
+                audio = next((asset for asset in job['assets'] if asset['field'] == 'audioUrl'), None)
+                if self.transcode and audio and 'renditions' not in job:
+                    job['renditions'], job['audioBitrate'] = self._transcode(job, os.path.join(job_dir, audio['file']))
+                    self._write(job)
+                if self.on_complete:
+                    self.on_complete(job)
+            except Exception as e:
+                self._job_failed(job, e)
+                return
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+            job.update(status='done', error=None, nextAttemptAt=None, finishedAt=_now())
+            self._write(job)
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._completed += 1
+                self._job_total += elapsed
+                self._last_job_ms = round(elapsed * 1000, 3)
+            print(f"✓ Media job {job_id} done ({len(job['assets'])} files, {elapsed:.1f}s)")
+
+    def _transcode(self, job, path):
+        try:
+            return self.transcode(path)
+        except Exception as e:
+            print(f"⚠️ Media job {job['id']}: no renditions, keeping the original audio: {e}")
+            job['transcodeError'] = str(e)
+            return [], getattr(e, 'source_kbps', None)
+
+    def _job_failed(self, job, error):
+        job['error'] = str(error)
+        if job['attempts'] < self.max_attempts:
+            delay = min(self.retry_seconds * 2 ** (job['attempts'] - 1), _MAX_BACKOFF)
+            job.update(status='retrying', nextAttemptAt=time.time() + delay)
+            self._write(job)
+            with self._cond:
+                self._retries += 1
+            self._schedule(job['id'], job['nextAttemptAt'])
+            print(f"⚠️ Media job {job['id']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {error}")
+            return
+
+        job.update(status='failed', nextAttemptAt=None, finishedAt=_now())
+        self._write(job)
+        with self._cond:
+            self._failed += 1
+        print(f"❌ Media job {job['id']} failed after {job['attempts']} attempts: {error}")
+        if self.on_failed:
+            try:
+                self.on_failed(job)
+            except Exception as e:
+                print(f"❌ Could not mark media job {job['id']} as failed: {e}")
+
+    def stats(self):
+        """Queue depth and job counters for this worker process"""
+        with self._cond:
+            completed = self._completed
+            return {
+                'backend': self.storage.name,
+                'workers': self.workers,
+                'scheduled': len(self._heap),
+                'running': self._running,
+                'completed': completed,
+                'failed': self._failed,
+                'retries': self._retries,
+                'lastJobMs': self._last_job_ms,
+                'jobMsAvg': round(self._job_total / completed * 1000, 3) if completed else 0.0
+            }
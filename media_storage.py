@@ -0,0 +1,256 @@
+"""
+VibeSync media storage - where uploaded audio, covers and artist photos live.
+
+Every backend has one operation, save(path, folder, sha256) -> URL: store a
+local file under a name derived from its content hash and return the URL
+players should use. Saving the same content twice is harmless.
+
+MEDIA_BACKEND picks the backend:
+
+  cloudinary  (default) Cloudinary, configured by CLOUDINARY_CLOUD_NAME /
+              CLOUDINARY_API_KEY / CLOUDINARY_API_SECRET
+  local       files copied under MEDIA_LOCAL_ROOT and served by this app
+              at /media/<folder>/<file> - for self-hosting, development
+              and tests. MEDIA_LOCAL_URL can point at a CDN in front of it.
+
+The local backend streams with HTTP semantics players and caches rely on:
+
+- Range requests (206 / 416, If-Range), so seeking never downloads the file
+- ETag (the content hash) and Last-Modified, answered with 304
+- Content-addressed files (<hash>.<ext>) are cached for a year as immutable;
+  other files (e.g. the older static/uploads/audio tracks) for
+  MEDIA_CACHE_MAX_AGE seconds and then revalidated
+- Zero-copy bodies: the file goes out through wsgi.file_wrapper limited to
+  the requested range, which gunicorn sends with os.sendfile(). Behind nginx,
+  MEDIA_X_ACCEL_PREFIX hands the whole transfer to nginx instead.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from datetime import datetime, timezone
+
+from werkzeug.http import http_date, is_resource_modified, parse_if_range_header, parse_range_header, quote_etag
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import FileWrapper
+
+MEDIA_BACKEND = os.getenv('MEDIA_BACKEND', 'cloudinary').lower()
+MEDIA_LOCAL_ROOT = os.getenv('MEDIA_LOCAL_ROOT', os.path.join('static', 'uploads'))
+MEDIA_LOCAL_URL = os.getenv('MEDIA_LOCAL_URL', '/media')
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', '3600'))
+MEDIA_X_ACCEL_PREFIX = os.getenv('MEDIA_X_ACCEL_PREFIX')  # e.g. /protected-media/ (an nginx internal location)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{32}$')
+_AUDIO_TYPES = {'.mp3': 'audio/mpeg', '.m4a': 'audio/mp4', '.ogg': 'audio/ogg', '.flac': 'audio/flac', '.wav': 'audio/wav'}
+_MAX_HASHED_FILES = 4096
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in 1 MB chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CloudinaryStorage:
+    """Uploads to Cloudinary as vibesync/<folder>/<hash>"""
+
+    name = 'cloudinary'
+
+    def __init__(self):
+        import cloudinary
+        import cloudinary.uploader
+
+        cloudinary.config(
+            cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+            api_key=os.getenv('CLOUDINARY_API_KEY'),
+            api_secret=os.getenv('CLOUDINARY_API_SECRET'),
+            secure=True
+        )
+        self._uploader = cloudinary.uploader
+
+    def save(self, path, folder, sha256):
+        """Upload a file; returns its secure URL"""
+        upload_result = self._uploader.upload(
+            path,
+            public_id=f"vibesync/{folder}/{sha256[:32]}",
+            resource_type='video' if folder == 'audio' else 'image',  # Cloudinary uses 'video' for audio
+            overwrite=False  # Re-uploading the same content is a no-op
+        )
+        return upload_result['secure_url']
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class _FileRange:
+    """A file object that ends `length` bytes after its current position
+
+    fileno() is the real descriptor, so gunicorn's sendfile() sends exactly
+    Content-Length bytes from the current offset without copying them
+    through Python; servers without sendfile fall back to read().
+    """
+
+    def __init__(self, file, length):
+        self._file = file
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class LocalStorage:
+    """Copies files to <root>/<folder>/<hash><ext> and serves them"""
+
+    name = 'local'
+
+    def __init__(self, root=MEDIA_LOCAL_ROOT, base_url=MEDIA_LOCAL_URL, max_age=MEDIA_CACHE_MAX_AGE,
+                 x_accel_prefix=MEDIA_X_ACCEL_PREFIX):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+        self.max_age = int(max_age)
+        self.x_accel_prefix = x_accel_prefix
+
+        self._lock = threading.Lock()
+        self._hashes = {}  # (path, mtime_ns, size) -> sha256, for files not named by hash
+        self._counts = {'200': 0, '206': 0, '304': 0, '416': 0}
+        self._bytes_sent = 0
+
+    def save(self, path, folder, sha256):
+        """Copy a file into the store; returns its URL"""
+        filename = sha256[:32] + os.path.splitext(path)[1].lower()
+        target = os.path.join(self.root, folder, filename)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f'{target}.{os.getpid()}.tmp'
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)  # Never expose a half-written file
+        return f'{self.base_url}/{folder}/{filename}'
+
+    # --------------------------------------------------------
+    # Serving
+    # --------------------------------------------------------
+
+    def _path_for(self, name):
+        parts = name.split('/')
+        if any(not part or part.startswith('.') for part in parts) or name.endswith('.tmp'):
+            return None
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, *parts))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _etag(self, path, stat):
+        """(etag, immutable): the hash in the name, or the file's SHA-256 cached per version"""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if _CONTENT_ADDRESSED.match(stem):
+            return stem, True
+
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            etag = self._hashes.get(key)
+        if etag is None:
+            etag = file_sha256(path)[:32]
+            with self._lock:
+                if len(self._hashes) >= _MAX_HASHED_FILES:
+                    self._hashes.clear()
+                self._hashes[key] = etag
+        return etag, False
+
+    def _count(self, status, sent=0):
+        with self._lock:
+            self._counts[str(status)] += 1
+            self._bytes_sent += sent
+
+    def serve(self, environ, name):
+        """A streaming response for /media/<name>, or None if there is no such file"""
+        path = self._path_for(name)
+        if path is None:
+            return None
+
+        stat = os.stat(path)
+        etag, immutable = self._etag(path, stat)
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+        headers = {
+            'ETag': quote_etag(etag),
+            'Last-Modified': http_date(last_modified),
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else f'public, max-age={self.max_age}',
+            'Accept-Ranges': 'bytes'
+        }
+        if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+            self._count(304)
+            return Response(status=304, headers=headers)
+
+        mimetype = _AUDIO_TYPES.get(os.path.splitext(path)[1].lower()) or \
+            mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.x_accel_prefix:
+            # nginx reads the file itself (applying Range) from an internal location
+            self._count(200)
+            headers['X-Accel-Redirect'] = self.x_accel_prefix.rstrip('/') + '/' + name
+            return Response(status=200, headers=headers, mimetype=mimetype)
+
+        size = stat.st_size
+        start, length, status = 0, size, 200
+        byte_range = parse_range_header(environ.get('HTTP_RANGE'))
+        if_range = parse_if_range_header(environ.get('HTTP_IF_RANGE'))
+        range_applies = (if_range.etag is None and if_range.date is None) or \
+            if_range.etag == etag or (if_range.date is not None and if_range.date >= last_modified)
+        # Malformed and multi-part ranges get the whole file, as RFC 9110 allows
+        if byte_range is not None and len(byte_range.ranges) == 1 and range_applies:
+            span = byte_range.range_for_length(size)
+            if span is None:
+                self._count(416)
+                headers['Content-Range'] = f'bytes */{size}'
+                return Response(status=416, headers=headers)
+            start, stop = span
+            length, status = stop - start, 206
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+
+        self._count(status, length)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            response = Response(status=status, headers=headers, mimetype=mimetype)
+        else:
+            file = open(path, 'rb')
+            file.seek(start)
+            file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+            response = Response(file_wrapper(_FileRange(file, length), 64 * 1024), status=status,
+                                headers=headers, mimetype=mimetype, direct_passthrough=True)
+        response.headers['Content-Length'] = str(length)
+        return response
+
+    def stats(self):
+        """Responses by status and bytes sent by this worker"""
+        with self._lock:
+            return {
+                'backend': self.name,
+                'root': self.root,
+                'responses': dict(self._counts),
+                'bytesSent': self._bytes_sent,
+                'hashedFiles': len(self._hashes)
+            }
+
+
+def create_media_storage(backend=MEDIA_BACKEND):
+    """The storage backend named by MEDIA_BACKEND"""
+    if backend == 'local':
+        return LocalStorage()
+    if backend == 'cloudinary':
+        return CloudinaryStorage()
+    raise ValueError(f"Unknown MEDIA_BACKEND '{backend}' (expected 'cloudinary' or 'local')")
@@ -0,0 +1,154 @@
+"""
+VibeSync song metadata cache.
+
+A read-through, LRU + TTL bounded, in-process cache for song documents and
+views derived from them (catalog pages, by-emotion, by-language, language
+list). The catalog only changes through the admin song routes, which call
+invalidate().
+
+With several gunicorn workers, point SONG_CACHE_VERSION_FILE at a local path
+shared by all of them: invalidate() bumps the version stored there and every
+worker drops its entries the next time it reads the cache.
+
+Cached values are shared between requests - treat them as read-only.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class SongCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=300.0, version_file=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.version_file = version_file or None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = self._read_shared_version()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    # --------------------------------------------------------
+    # Shared invalidation across worker processes
+    # --------------------------------------------------------
+
+    def _read_shared_version(self):
+        if not self.version_file:
+            return None
+        try:
+            with open(self.version_file) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _bump_shared_version(self):
+        if not self.version_file:
+            return
+        version = f'{time.time_ns()}-{os.getpid()}'
+        tmp_path = f'{self.version_file}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(version)
+            os.replace(tmp_path, self.version_file)  # Atomic on POSIX
+            self._version = version
+        except OSError as e:
+            print(f"⚠️ Could not update song cache version file: {e}")
+
+    def _sync_with_shared_version(self):
+        version = self._read_shared_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    # --------------------------------------------------------
+    # Cache operations
+    # --------------------------------------------------------
+
+    def get(self, key, default=None):
+        """Return a fresh cached value, or default"""
+        if not self.enabled:
+            return default
+
+        with self._lock:
+            self._sync_with_shared_version()
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[0] < time.monotonic():
+                if entry is not _MISSING:
+                    del self._entries[key]
+                self._misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Read-through: return the cached value or call loader() and cache it"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are cached and fresh"""
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def current_version(self):
+        """The shared catalog version (None without a version file)"""
+        with self._lock:
+            self._sync_with_shared_version()
+            return self._version
+
+    def invalidate(self):
+        """Drop everything (in every worker sharing the version file)"""
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+            self._bump_shared_version()
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttlSeconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRatio': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'sharedVersionFile': self.version_file
+            }
@@ -0,0 +1,576 @@
+"""
+VibeSync bulk song import - load many songs from a manifest and media files.
+
+A manifest (CSV with a header row, or JSON Lines) has one song per line:
+
+    title,artist,emotions,language,audio,cover,artistPhoto
+    Opalite,Taylor Swift,happy;calm,English,audio/opalite.mp3,covers/opalite.jpg,
+
+emotions is a ';' or '|' separated list (a JSON list in JSONL). audio, cover
+and artistPhoto are paths inside the media source - a directory under
+SONG_IMPORT_MEDIA_ROOT or an uploaded .zip/.tar(.gz) archive - or http(s)
+URLs that are stored as they are.
+
+- Assets are uploaded by a bounded thread pool (SONG_IMPORT_WORKERS) and the
+  songs of each batch (SONG_IMPORT_BATCH_SIZE rows) go in one insert_many().
+- Dedup: each song gets contentHash, the SHA-256 of its audio file (of the
+  URL for URL-only rows), backed by a unique index. Rows whose hash is in the
+  catalog or earlier in the manifest are skipped. Assets are uploaded under
+  a name derived from their own hash, so a repeated upload is idempotent.
+- With a transcode callable (audio_renditions.create_renditions), each audio
+  file is also encoded into the song's bitrate renditions in the same pool.
+  A track that cannot be transcoded is still imported with its original
+  audio and no renditions (counted in transcodeFailures).
+- Resumable: every uploaded asset and written song is appended to the
+  import's state file. Submitting the same manifest and media again (same
+  import ID) continues where the last run stopped.
+- Progress is written to progress.json after every batch, so any worker can
+  answer GET /api/songs/import/<import_id>.
+"""
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from media_storage import file_sha256
+
+SONG_IMPORT_DIR = os.getenv('SONG_IMPORT_DIR', os.path.join('instance', 'song_imports'))
+SONG_IMPORT_WORKERS = int(os.getenv('SONG_IMPORT_WORKERS', '8'))
+SONG_IMPORT_BATCH_SIZE = int(os.getenv('SONG_IMPORT_BATCH_SIZE', '100'))
+
+MANIFEST_EXTENSIONS = ('.csv', '.jsonl')
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+# (song field, upload folder, manifest columns)
+_ASSET_FIELDS = (
+    ('audioUrl', 'audio', ('audio', 'audioFile', 'audioUrl')),
+    ('coverUrl', 'covers', ('cover', 'coverFile', 'coverUrl')),
+    ('artistPhotoUrl', 'artists', ('artistPhoto', 'artistPhotoFile', 'artistPhotoUrl'))
+)
+_MAX_REPORTED_ERRORS = 50
+_DUPLICATE_KEY = 11000
+
+
+def _inside(root, path):
+    root = os.path.realpath(root)
+    path = os.path.realpath(path)
+    return path == root or path.startswith(root + os.sep)
+
+
+def _extension(filename, extensions):
+    name = filename.lower()
+    return next((ext for ext in extensions if name.endswith(ext)), None)
+
+
+def _now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)  # Readers never see a partial file
+
+
+# ============================================================
+# MANIFEST
+# ============================================================
+
+def parse_manifest(path):
+    """Yield (line number, row dict or None, error or None) for each song"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if path.endswith('.jsonl'):
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield number, None, f'Invalid JSON: {e}'
+                    continue
+                if isinstance(row, dict):
+                    yield number, row, None
+                else:
+                    yield number, None, 'Expected a JSON object'
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+
+
+def _song_from_row(row):
+    """Split a manifest row into song fields and {song field: asset reference}"""
+    title = str(row.get('title') or '').strip()
+    artist = str(row.get('artist') or '').strip()
+    emotions = row.get('emotions') or []
+    if isinstance(emotions, str):
+        emotions = emotions.replace('|', ';').split(';')
+    emotions = list(dict.fromkeys(str(e).strip().lower() for e in emotions if str(e).strip()))
+
+    if not title or not artist:
+        raise ValueError('Title and artist required')
+    if not emotions:
+        raise ValueError('At least one emotion required')
+
+    assets = {}
+    for field, _, columns in _ASSET_FIELDS:
+        value = next((str(row[column]).strip() for column in columns if row.get(column)), '')
+        if value:
+            assets[field] = value
+    if 'audioUrl' not in assets:
+        raise ValueError('Audio file or URL required')
+
+    fields = {
+        'title': title,
+        'artist': artist,
+        'emotions': emotions,
+        'language': str(row.get('language') or 'English').strip()
+    }
+    return fields, assets
+
+
+# ============================================================
+# IMPORT DIRECTORIES
+# ============================================================
+
+def _save_upload(file, path):
+    """Stream a werkzeug FileStorage to path; returns its SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def prepare_import(manifest_file, media_root=None, media_dir=None, archive_file=None, base_dir=SONG_IMPORT_DIR):
+    """Store an import's manifest (and archive) and return its import ID
+
+    media_dir is relative to media_root. The ID is derived from the manifest
+    and the media source, so the same submission maps to the same import
+    directory and resumes it. Raises ValueError for unusable input.
+    """
+    manifest_ext = _extension(manifest_file.filename or '', MANIFEST_EXTENSIONS)
+    if not manifest_ext:
+        raise ValueError('Manifest must be a .csv or .jsonl file')
+
+    archive_ext = None
+    if archive_file is not None and archive_file.filename:
+        archive_ext = _extension(archive_file.filename, ARCHIVE_EXTENSIONS)
+        if not archive_ext:
+            raise ValueError('Archive must be a .zip, .tar, .tar.gz or .tgz file')
+    elif media_dir:
+        if not media_root:
+            raise ValueError('Media directories are not enabled')
+        media_dir = os.path.realpath(os.path.join(media_root, media_dir))
+        if not _inside(media_root, media_dir) or not os.path.isdir(media_dir):
+            raise ValueError('Media directory not found')
+    else:
+        media_dir = None  # URL-only manifest
+
+    os.makedirs(base_dir, exist_ok=True)
+    tmp_prefix = os.path.join(base_dir, f'.upload-{os.getpid()}-{threading.get_ident()}')
+    manifest_tmp = tmp_prefix + manifest_ext
+    archive_tmp = tmp_prefix + archive_ext if archive_ext else None
+    try:
+        source = _save_upload(manifest_file, manifest_tmp)
+        source += '|' + (_save_upload(archive_file, archive_tmp) if archive_ext else media_dir or '')
+        import_id = hashlib.sha256(source.encode()).hexdigest()[:16]
+
+        import_dir = os.path.join(base_dir, import_id)
+        if not os.path.isdir(import_dir):
+            os.makedirs(import_dir)
+            os.replace(manifest_tmp, os.path.join(import_dir, 'manifest' + manifest_ext))
+            archive_path = None
+            if archive_ext:
+                archive_path = os.path.join(import_dir, 'media' + archive_ext)
+                os.replace(archive_tmp, archive_path)
+            _write_json(os.path.join(import_dir, 'import.json'), {
+                'manifest': 'manifest' + manifest_ext,
+                'archive': os.path.basename(archive_path) if archive_path else None,
+                'mediaDir': media_dir,
+                'createdAt': _now()
+            })
+        return import_id
+    finally:
+        for path in (manifest_tmp, archive_tmp):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def _extract_archive(archive_path, dest):
+    """Unpack a zip/tar archive into dest, refusing paths that escape it"""
+    partial = dest + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    if archive_path.endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            for name in archive.namelist():
+                if not _inside(partial, os.path.join(partial, name)):
+                    raise ValueError(f'Unsafe archive member: {name}')
+            archive.extractall(partial)
+    else:
+        with tarfile.open(archive_path) as archive:
+            members = archive.getmembers()
+            for member in members:
+                if not (member.isfile() or member.isdir()) or not _inside(partial, os.path.join(partial, member.name)):
+                    raise ValueError(f'Unsafe archive member: {member.name}')
+            archive.extractall(partial, members)
+    os.replace(partial, dest)
+
+
+def read_progress(import_id, base_dir=SONG_IMPORT_DIR):
+    """The last progress written for an import, or None"""
+    if len(import_id) != 16 or any(c not in '0123456789abcdef' for c in import_id):
+        return None
+    try:
+        with open(os.path.join(base_dir, import_id, 'progress.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ============================================================
+# IMPORT RUN
+# ============================================================
+
+def _attempt(fn, *args):
+    # Pool tasks report errors per row instead of failing the batch
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, str(e)
+
+
+class SongImport:
+    """One run of a prepared import
+
+    upload(path, folder, sha256) stores a file and returns its URL (a media
+    storage backend's save).
+    allowed_extensions maps each folder ('audio', 'covers', 'artists') to
+    the extensions it accepts. on_inserted(songs) is called after every
+    insert_many() with the new documents. transcode(path) returns (renditions,
+    source kbps) for an audio file.
+    """
+
+    def __init__(self, import_id, collection, upload, allowed_extensions, uploaded_by=None,
+                 on_inserted=None, workers=SONG_IMPORT_WORKERS, batch_size=SONG_IMPORT_BATCH_SIZE,
+                 base_dir=SONG_IMPORT_DIR, transcode=None):
+        self.import_id = import_id
+        self.import_dir = os.path.join(base_dir, import_id)
+        self.collection = collection
+        self.upload = upload
+        self.allowed_extensions = allowed_extensions
+        self.uploaded_by = uploaded_by
+        self.on_inserted = on_inserted
+        self.transcode = transcode
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+
+        with open(os.path.join(self.import_dir, 'import.json')) as f:
+            self.spec = json.load(f)
+
+        self._lock = threading.Lock()
+        self._state_file = None
+        self._assets = {}  # (folder, sha256) -> URL
+        self._renditions = {}  # audio sha256 -> (renditions, source kbps)
+        self._seen = set()  # contentHash of songs written or queued
+        self._progress = {
+            'importId': import_id,
+            'status': 'pending',
+            'rows': 0,
+            'processed': 0,
+            'inserted': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'uploadedAssets': 0,
+            'reusedAssets': 0,
+            'transcoded': 0,
+            'transcodeFailures': 0,
+            'errors': [],
+            'error': None,
+            'startedAt': None,
+            'finishedAt': None,
+            'updatedAt': _now()
+        }
+
+    # --------------------------------------------------------
+    # Progress and state
+    # --------------------------------------------------------
+
+    def progress(self):
+        """Counters for this run"""
+        with self._lock:
+            return dict(self._progress, errors=list(self._progress['errors']))
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, amount in increments.items():
+                self._progress[name] += amount
+
+    def _fail(self, line, message):
+        with self._lock:
+            self._progress['failed'] += 1
+            if len(self._progress['errors']) < _MAX_REPORTED_ERRORS:
+                self._progress['errors'].append({'line': line, 'error': message})
+
+    def _write_progress(self):
+        progress = self.progress()
+        progress['updatedAt'] = _now()
+        _write_json(os.path.join(self.import_dir, 'progress.json'), progress)
+
+    def _load_state(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from an interrupted run
+                if 'asset' in record:
+                    self._assets[(record['folder'], record['asset'])] = record['url']
+                elif 'renditions' in record:
+                    self._renditions[record['renditions']] = (record['list'], record['audioBitrate'])
+                elif 'song' in record:
+                    self._seen.add(record['song'])
+
+    def _record(self, record):
+        with self._lock:
+            self._state_file.write(json.dumps(record) + '\n')
+            self._state_file.flush()
+
+    # --------------------------------------------------------
+    # Assets
+    # --------------------------------------------------------
+
+    def _media_root(self):
+        if self.spec.get('archive'):
+            media_root = os.path.join(self.import_dir, 'media')
+            if not os.path.isdir(media_root):
+                _extract_archive(os.path.join(self.import_dir, self.spec['archive']), media_root)
+            return media_root
+        return self.spec.get('mediaDir')
+
+    def _resolve(self, media_root, folder, value):
+        """('url', url) or ('file', absolute path) for a manifest reference"""
+        if value.startswith(('http://', 'https://')):
+            return 'url', value
+        if not media_root:
+            raise ValueError(f'{value}: no media directory or archive given')
+        path = os.path.join(media_root, value)
+        if not _inside(media_root, path) or not os.path.isfile(path):
+            raise ValueError(f'{value}: file not found')
+        if not _extension(value, tuple('.' + ext for ext in self.allowed_extensions[folder])):
+            raise ValueError(f'{value}: unsupported file type')
+        return 'file', path
+
+    def _content_hash(self, source):
+        kind, value = source
+        return hashlib.sha256(value.encode()).hexdigest() if kind == 'url' else file_sha256(value)
+
+    def _upload_asset(self, folder, path, sha256=None):
+        sha256 = sha256 or file_sha256(path)
+        with self._lock:
+            url = self._assets.get((folder, sha256))
+        if url is not None:
+            self._count(reusedAssets=1)
+            return url
+
+        url = self.upload(path, folder, sha256)
+        with self._lock:
+            self._assets[(folder, sha256)] = url
+        self._record({'asset': sha256, 'folder': folder, 'url': url})
+        self._count(uploadedAssets=1)
+        return url
+
+    def _transcode_audio(self, path, sha256):
+        with self._lock:
+            result = self._renditions.get(sha256)
+        if result is not None:
+            return result
+
+        try:
+            renditions, source_kbps = self.transcode(path)
+        except Exception as e:
+            print(f"⚠️ Song import {self.import_id}: no renditions for {os.path.basename(path)}: {e}")
+            self._count(transcodeFailures=1)
+            return [], getattr(e, 'source_kbps', None)
+        with self._lock:
+            self._renditions[sha256] = (renditions, source_kbps)
+        self._record({'renditions': sha256, 'list': renditions, 'audioBitrate': source_kbps})
+        self._count(transcoded=1)
+        return renditions, source_kbps
+
+    # --------------------------------------------------------
+    # Batches
+    # --------------------------------------------------------
+
+    def _import_batch(self, pool, media_root, rows):
+        folders = {field: folder for field, folder, _ in _ASSET_FIELDS}
+
+        # Validate rows and resolve their files
+        candidates = []
+        for line, row, error in rows:
+            if error is None:
+                try:
+                    fields, assets = _song_from_row(row)
+                    sources = {field: self._resolve(media_root, folders[field], value)
+                               for field, value in assets.items()}
+                    candidates.append((line, fields, sources))
+                    continue
+                except ValueError as e:
+                    error = str(e)
+            self._fail(line, error)
+
+        # Content hashes, then skip songs already imported or seen in this manifest
+        hashes = pool.map(lambda candidate: _attempt(self._content_hash, candidate[2]['audioUrl']), candidates)
+        fresh = []
+        for (line, fields, sources), (content_hash, error) in zip(candidates, list(hashes)):
+            if error:
+                self._fail(line, error)
+            elif content_hash in self._seen:
+                self._count(duplicates=1)
+            else:
+                self._seen.add(content_hash)
+                fresh.append((line, fields, sources, content_hash))
+
+        if fresh:
+            existing = self.collection.find({'contentHash': {'$in': [item[3] for item in fresh]}}, {'contentHash': 1})
+            existing = {doc['contentHash'] for doc in existing}
+            for content_hash in existing:
+                self._record({'song': content_hash})
+            self._count(duplicates=len(existing))
+            fresh = [item for item in fresh if item[3] not in existing]
+
+        # Upload every distinct file concurrently
+        uploads = {}
+        for line, fields, sources, content_hash in fresh:
+            for field, (kind, value) in sources.items():
+                key = (folders[field], value)
+                if kind == 'file' and key not in uploads:
+                    known_hash = content_hash if field == 'audioUrl' else None
+                    uploads[key] = pool.submit(_attempt, self._upload_asset, folders[field], value, known_hash)
+            kind, value = sources['audioUrl']
+            if self.transcode and kind == 'file' and ('renditions', value) not in uploads:
+                uploads[('renditions', value)] = pool.submit(self._transcode_audio, value, content_hash)
+
+        documents = []
+        for line, fields, sources, content_hash in fresh:
+            song = dict(fields, audioUrl='', coverUrl='', artistPhotoUrl='')
+            errors = []
+            for field, (kind, value) in sources.items():
+                if kind == 'url':
+                    song[field] = value
+                    continue
+                url, error = uploads[(folders[field], value)].result()
+                if error:
+                    errors.append(f'{os.path.relpath(value, media_root)}: {error}')
+                song[field] = url
+            kind, value = sources['audioUrl']
+            if ('renditions', value) in uploads:
+                song['renditions'], song['audioBitrate'] = uploads[('renditions', value)].result()
+            if errors:
+                self._seen.discard(content_hash)  # Retried by the next run
+                self._fail(line, '; '.join(errors))
+                continue
+
+            now = datetime.utcnow()
+            song.update({
+                'coverUrl': song['coverUrl'] or f'https://picsum.photos/400/400?random={content_hash[:8]}',
+                'contentHash': content_hash,
+                'createdAt': now,
+                'updatedAt': now,
+                'uploadedBy': self.uploaded_by
+            })
+            documents.append((line, song))
+
+        if documents:
+            self._insert(documents)
+
+    def _insert(self, documents):
+        write_errors = {}
+        try:
+            self.collection.insert_many([song for _, song in documents], ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error['index']: error for error in e.details.get('writeErrors', [])}
+
+        inserted = []
+        for index, (line, song) in enumerate(documents):
+            error = write_errors.get(index)
+            if error is None:
+                inserted.append(song)
+                self._record({'song': song['contentHash'], 'id': str(song['_id'])})
+            elif error.get('code') == _DUPLICATE_KEY:
+                self._record({'song': song['contentHash']})  # Imported concurrently
+                self._count(duplicates=1)
+            else:
+                self._fail(line, error.get('errmsg', 'Insert failed'))
+
+        self._count(inserted=len(inserted))
+        if inserted and self.on_inserted:
+            self.on_inserted(inserted)
+
+    def run(self):
+        """Import every row not imported yet; returns the final progress
+
+        Only one process runs an import at a time; a second call while it is
+        running returns None.
+        """
+        lock_file = open(os.path.join(self.import_dir, 'lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            print(f"⚠️ Song import {self.import_id} is already running")
+            return None
+
+        try:
+            with self._lock:
+                self._progress.update(status='running', startedAt=_now())
+            self._write_progress()
+
+            media_root = self._media_root()
+            rows = list(parse_manifest(os.path.join(self.import_dir, self.spec['manifest'])))
+            with self._lock:
+                self._progress['rows'] = len(rows)
+
+            state_path = os.path.join(self.import_dir, 'state.jsonl')
+            self._load_state(state_path)
+            with open(state_path, 'a') as self._state_file, \
+                    ThreadPoolExecutor(self.workers, thread_name_prefix='song-import') as pool:
+                for start in range(0, len(rows), self.batch_size):
+                    batch = rows[start:start + self.batch_size]
+                    self._import_batch(pool, media_root, batch)
+                    self._count(processed=len(batch))
+                    self._write_progress()
+
+            with self._lock:
+                self._progress.update(status='done', finishedAt=_now())
+            progress = self.progress()
+            print(f"✓ Song import {self.import_id}: {progress['inserted']} added, "
+                  f"{progress['duplicates']} duplicates, {progress['failed']} failed")
+        except Exception as e:
+            print(f"❌ Song import {self.import_id} failed: {e}")
+            with self._lock:
+                self._progress.update(status='failed', error=str(e), finishedAt=_now())
+        finally:
+            self._state_file = None
+            self._write_progress()
+            lock_file.close()  # Releases the lock
+        return self.progress()
+
+    def start(self):
+        """Run in a background thread"""
+        thread = threading.Thread(target=self.run, name=f'song-import-{self.import_id}', daemon=True)
+        thread.start()
+        return thread
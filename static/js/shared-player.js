@@ -59,7 +59,7 @@ window.sharedAudioPlayer = {
                     
                     // Restore audio
                     if (this.currentSong.audioUrl) {
-                        this.audio.src = this.currentSong.audioUrl;
+                        this.audio.src = this.streamUrl(this.currentSong, this.currentSong.audioUrl);
                         this.audio.currentTime = this.currentTime;
                         this.audio.volume = this.volume;
                         
@@ -96,6 +96,22 @@ window.sharedAudioPlayer = {
         }
     },
     
+    // Songs with renditions go through /stream, which redirects to the
+    // bitrate that suits the connection (Network Information API hints)
+    streamUrl(song, audioUrl) {
+        if (!song.id || !song.renditions || song.renditions.length === 0) {
+            return audioUrl;
+        }
+        const params = new URLSearchParams({ redirect: '1' });
+        const connection = navigator.connection;
+        if (connection) {
+            if (connection.effectiveType) params.set('network', connection.effectiveType);
+            if (connection.downlink) params.set('downlink', connection.downlink);
+            if (connection.saveData) params.set('saveData', '1');
+        }
+        return `/api/songs/${encodeURIComponent(song.id)}/stream?${params}`;
+    },
+    
     playSong(song, playlist = []) {
         this.currentSong = song;
         this.currentPlaylist = playlist;
@@ -122,7 +138,7 @@ window.sharedAudioPlayer = {
             return;
         }
 
-        this.audio.src = audioUrl;
+        this.audio.src = this.streamUrl(song, audioUrl);
         this.audio.play().then(() => {
             this.isPlaying = true;
             this.updatePlayPauseButton();
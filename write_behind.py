@@ -0,0 +1,243 @@
+"""
+VibeSync write-behind queue for high-volume event rows.
+
+emotion_history gets a row on every detection and recently_played on every
+track start. Instead of one INSERT + COMMIT per request, rows are buffered
+in-process and a background thread writes them with one execute_values()
+INSERT per table every flush_interval_ms, or as soon as batch_rows are
+waiting.
+
+- Backpressure: at most max_pending rows are buffered. Producers then wait
+  up to enqueue_timeout seconds for a flush, and after that write their row
+  synchronously. A slow Postgres slows callers down instead of letting the
+  buffer grow without bound.
+- Durability: close() (registered with atexit and called from the gunicorn
+  worker_exit hook) stops the thread and flushes whatever is left. A failed
+  flush keeps its rows and retries with backoff.
+- Timestamps are taken at enqueue time, not at flush time.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+
+class WriteBehindQueue:
+    """Buffers rows per table and flushes them in batches"""
+
+    def __init__(self, pool, tables, flush_interval_ms=500, batch_rows=500, max_pending=10000,
+                 enqueue_timeout=2.0, enabled=True):
+        self.pool = pool
+        self.tables = {table: tuple(columns) for table, columns in tables.items()}
+        self.flush_interval = max(0.01, float(flush_interval_ms) / 1000.0)
+        self.batch_rows = max(1, int(batch_rows))
+        self.max_pending = max(self.batch_rows, int(max_pending))
+        self.enqueue_timeout = max(0.0, float(enqueue_timeout))
+        self.enabled = enabled
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._buffers = {table: [] for table in self.tables}
+        self._pending = 0
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._flushes = 0
+        self._rows_written = 0
+        self._failures = 0
+        self._rejected = 0
+        self._blocked = 0
+        self._sync_writes = 0
+        self._flush_total = 0.0
+        self._flush_max = 0.0
+        self._last_flush_ms = None
+
+    def _ensure_started(self):
+        # Started lazily so each gunicorn worker gets its own thread and buffer
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                self._buffers = {table: [] for table in self.tables}
+                self._pending = 0
+                self._stopping = False
+                self._reset_metrics()
+                self._pid = os.getpid()
+                self._thread = None
+            if self._stopping:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+
+    # --------------------------------------------------------
+    # Producers
+    # --------------------------------------------------------
+
+    def enqueue(self, table, row):
+        """Buffer one row (a dict keyed by column); missing columns are NULL
+
+        A timestamp column the row leaves out is stamped with the current
+        time here, so late flushes keep the event time.
+        """
+        columns = self.tables[table]
+        now = datetime.now(timezone.utc)
+        values = tuple(row.get(column, now if column.endswith('_at') else None) for column in columns)
+
+        if not self.enabled:
+            self._write_now(table, [values])
+            return
+
+        self._ensure_started()
+        with self._cond:
+            if not self._stopping:
+                deadline = time.monotonic() + self.enqueue_timeout
+                if self._pending >= self.max_pending:
+                    self._blocked += 1
+                while self._pending >= self.max_pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                if self._pending < self.max_pending:
+                    self._buffers[table].append(values)
+                    self._pending += 1
+                    if self._pending >= self.batch_rows:
+                        self._cond.notify_all()
+                    return
+
+        # Buffer still full (or shutting down): write through
+        self._write_now(table, [values])
+
+    def _write_now(self, table, rows):
+        with self._cond:
+            self._sync_writes += 1
+        with self.pool.connection() as conn:
+            self._insert(conn, table, rows)
+
+    # --------------------------------------------------------
+    # Flushing
+    # --------------------------------------------------------
+
+    def _insert(self, conn, table, rows):
+        columns = self.tables[table]
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+                rows,
+                page_size=len(rows)
+            )
+
+    def _insert_rows_one_by_one(self, table, rows):
+        # A constraint violation fails the whole batch; keep the good rows
+        written = 0
+        with self.pool.connection() as conn:
+            for row in rows:
+                try:
+                    self._insert(conn, table, [row])
+                    conn.commit()
+                    written += 1
+                except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                    conn.rollback()
+                    print(f"⚠️ Dropping {table} row {row!r}: {e}")
+        return written
+
+    def flush(self):
+        """Write every buffered row now; returns False if Postgres failed"""
+        with self._flush_lock:
+            with self._cond:
+                batches = {table: rows for table, rows in self._buffers.items() if rows}
+                for table in batches:
+                    self._buffers[table] = []
+            if not batches:
+                return True
+
+            started = time.monotonic()
+            ok = True
+            for table, rows in batches.items():
+                try:
+                    try:
+                        with self.pool.connection() as conn:
+                            self._insert(conn, table, rows)
+                        written = len(rows)
+                    except (psycopg2.IntegrityError, psycopg2.DataError):
+                        written = self._insert_rows_one_by_one(table, rows)
+                except Exception as e:
+                    print(f"❌ Write-behind flush of {len(rows)} {table} rows failed: {e}")
+                    ok = False
+                    with self._cond:
+                        self._buffers[table][:0] = rows  # Keep order; retried next flush
+                        self._failures += 1
+                    continue
+
+                with self._cond:
+                    self._pending -= len(rows)
+                    self._rows_written += written
+                    self._rejected += len(rows) - written
+                    self._cond.notify_all()  # Wake producers waiting for space
+
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._flushes += 1
+                self._flush_total += elapsed
+                self._flush_max = max(self._flush_max, elapsed)
+                self._last_flush_ms = round(elapsed * 1000, 3)
+            return ok
+
+    def _run(self):
+        backoff = self.flush_interval
+        while True:
+            with self._cond:
+                if not self._stopping and self._pending < self.batch_rows:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+
+            if self.flush():
+                backoff = self.flush_interval
+            elif not stopping:
+                # Postgres is failing: wait longer between retries (up to 30s)
+                backoff = min(backoff * 2, 30.0)
+                with self._cond:
+                    self._cond.wait(backoff)
+
+            if stopping:
+                return
+
+    def close(self, timeout=10.0):
+        """Stop the flusher and write everything still buffered"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        if self._pending and self._pid == os.getpid():
+            self.flush()
+
+    def stats(self):
+        """Queue depth and flush latency for monitoring"""
+        with self._cond:
+            flushes = self._flushes
+            return {
+                'enabled': self.enabled,
+                'pending': self._pending,
+                'pendingByTable': {table: len(rows) for table, rows in self._buffers.items()},
+                'maxPending': self.max_pending,
+                'flushes': flushes,
+                'rowsWritten': self._rows_written,
+                'rejectedRows': self._rejected,
+                'failedFlushes': self._failures,
+                'blockedEnqueues': self._blocked,
+                'syncWrites': self._sync_writes,
+                'lastFlushMs': self._last_flush_ms,
+                'flushMsAvg': round(self._flush_total / flushes * 1000, 3) if flushes else 0.0,
+                'flushMsMax': round(self._flush_max * 1000, 3)
+            }